@@ -1,7 +1,19 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, make_response
 from flask_cors import CORS
-from main import StoryGenerator
+from main import StoryGenerator, StoryWriteError, PDF_IN_MEMORY, illustration_scene
+from image_processing import image_mime_type
+from jobs import JobQueue, QueueFullError
+from surprise_pool import SurprisePool
+from pdf_pool import PdfPoolFullError, PdfRenderTimeout, PdfWorkerError
+from rate_limiter import CHAT_GOVERNOR, IMAGE_GOVERNOR
+from artifact_store import ArtifactStore
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import tracing
+import functools
 import os
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import base64
 from io import BytesIO
@@ -12,39 +24,225 @@ CORS(app)
 # Initialize the story generator
 generator = StoryGenerator()
 
+# Background workers for queued story requests
+job_queue = JobQueue(generator)
+
+# Finished random stories kept ready for "Surprise me". The warmer is started
+# explicitly (never on import), since spawned PDF workers re-import this module.
+surprise_pool = SurprisePool(generator, with_pdf=not PDF_IN_MEMORY)
+
+@app.before_first_request
+def start_surprise_pool():
+    surprise_pool.start()
+
+def traced_route(view):
+    """Run a view in a root tracing span and return its trace ID as X-Request-ID."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with tracing.span(request.endpoint, method=request.method, path=request.path) as span:
+            response = make_response(view(*args, **kwargs))
+            span.set(status=response.status_code)
+        response.headers['X-Request-ID'] = span.trace_id
+        return response
+    return wrapper
+
+@app.errorhandler(StoryWriteError)
+def story_write_error(e):
+    return jsonify({'error': str(e)}), 502
+
+@app.errorhandler(PdfPoolFullError)
+def pdf_pool_full(e):
+    return jsonify({'error': str(e)}), 503
+
+@app.errorhandler(PdfRenderTimeout)
+def pdf_render_timeout(e):
+    return jsonify({'error': str(e)}), 504
+
+@app.errorhandler(PdfWorkerError)
+def pdf_worker_error(e):
+    return jsonify({'error': str(e)}), 503
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
 @app.route('/generate_story', methods=['POST'])
+@traced_route
 def generate_story():
     data = request.json
     user_input = data.get('prompt', '')
+    request_id = tracing.current_span().trace_id
+    
+    if int(data.get('best_of', 1)) > 1:
+        # Several candidates, each already judged; keep the highest scoring one
+        story, feedback = generator.generate_best_story(user_input, n=int(data['best_of']))
+        result = {'story': story, 'feedback': feedback, 'pdf_filename': None}
+        if not PDF_IN_MEMORY:
+            generator.add_pdf(result, user_input)
+        return jsonify({'request_id': request_id, **result})
     
-    # Generate story
-    story, feedback = generator.generate_story(user_input)
+    # Judged in the background while the PDF is built (in-memory PDFs are built on download
+    # instead); with async_judge the feedback is collected from /feedback/<story_id>
+    async_judge = bool(data.get('async_judge'))
+    result = generator.run_story_request(user_input, mode=data.get('mode'), reuse=data.get('reuse', True),
+                                         async_judge=async_judge, with_pdf=not PDF_IN_MEMORY)
+    response = {'request_id': request_id, **result}
+    if async_judge and result['feedback'] is None:
+        response['feedback_url'] = f"/feedback/{result['story_id']}"
+    return jsonify(response)
+
+@app.route('/random_story')
+@traced_route
+def random_story():
+    surprise = surprise_pool.take()
+    if surprise is not None:
+        tracing.set_attributes(warm=True)
+        return jsonify({
+            'request_id': tracing.current_span().trace_id,
+            'prompt': surprise['prompt'],
+            'story': surprise['story'],
+            'feedback': surprise['feedback'],
+            'pdf_filename': surprise['pdf_filename'],
+            'warm': True
+        })
     
-    # Generate PDF
-    pdf_filename = generator.generate_pdf(story, feedback, user_input)
+    tracing.set_attributes(warm=False)
+    user_input = surprise_pool.random_prompt()
+    if request.args.get('warm_only'):
+        # The caller will write (and stream) the story for this prompt itself
+        return jsonify({'request_id': tracing.current_span().trace_id, 'prompt': user_input,
+                        'story': None, 'warm': False})
     
+    # The stock ran out; write one now as /generate_story would. The prompts repeat
+    # by design, so never hand back an earlier story for one.
+    result = generator.run_story_request(user_input, reuse=False, with_pdf=not PDF_IN_MEMORY)
     return jsonify({
-        'story': story,
-        'feedback': feedback,
-        'pdf_filename': pdf_filename
+        'request_id': tracing.current_span().trace_id,
+        'prompt': user_input,
+        **result,
+        'warm': False
     })
 
+@app.route('/feedback/<story_id>')
+def story_feedback(story_id):
+    status = generator.judge_status(story_id)
+    if status is None:
+        return jsonify({'error': 'Story not found'}), 404
+    if status == 'pending':
+        return jsonify({'story_id': story_id, 'status': status}), 202
+    return jsonify({'story_id': story_id, 'status': status, 'feedback': generator.get_feedback(story_id)})
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    data = request.json
+    user_input = data.get('prompt', '')
+    
+    try:
+        job = job_queue.submit(user_input, reuse=data.get('reuse', True))
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/jobs/{job.id}'
+    }), 202
+
+@app.route('/traces/<request_id>')
+def trace(request_id):
+    spans = tracing.get_trace(request_id)
+    if not spans:
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify({'request_id': request_id, 'spans': spans})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+# Seconds between SSE keep-alive comments while the PDF is being built,
+# so proxies don't drop the connection as idle
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+def sse_event(event, data):
+    """Format a single Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/generate_story_stream')
+def generate_story_stream():
+    user_input = request.args.get('prompt', '')
+    reuse = request.args.get('reuse', 'true').lower() not in ('0', 'false', 'no')
+    
+    def events():
+        with tracing.span('generate_story_stream', method='GET', path='/generate_story_stream') as span:
+            yield sse_event('request', {'request_id': span.trace_id})
+            yield from story_events()
+    
+    def story_events():
+        # The pipeline runs on its own thread and hands each part over as it is ready,
+        # so this one can keep the connection alive while the judge and PDF finish
+        parts = queue.Queue()
+        
+        def on_event(event, value):
+            if event == 'token':
+                parts.put(('token', {'text': value}))
+            elif event == 'story':
+                story = {'story_id': value['story_id']}
+                if value.get('reused'):
+                    story['reused'] = True
+                parts.put(('story', story))
+            elif event == 'feedback':
+                parts.put(('feedback', value))
+            elif event == 'pdf':
+                # Without a PDF the story is still good; the page falls back to rendering on download
+                pdf = {'pdf_filename': value['pdf_filename']}
+                if 'pdf_error' in value:
+                    pdf['error'] = value['pdf_error']
+                parts.put(('pdf', pdf))
+        
+        def run():
+            try:
+                generator.run_story_request(user_input, reuse=reuse, stream=True, with_pdf=not PDF_IN_MEMORY,
+                                            on_event=on_event)
+            except StoryWriteError as e:
+                # The stream failed before any text arrived; nothing worth judging or rendering
+                parts.put(('error', {'error': str(e)}))
+            finally:
+                parts.put(('done', {}))
+        
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(tracing.bind(run))
+            while True:
+                try:
+                    event, data = parts.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield sse_event(event, data)
+                if event == 'done':
+                    break
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/generate_image', methods=['POST'])
+@traced_route
 def generate_image():
     data = request.json
     prompt = data.get('prompt', '')
     
     try:
         # Call DALL-E API to generate image
-        response = openai.Image.create(
-            prompt=prompt,
-            n=1,
-            size="512x512"
-        )
+        response = generator.image_client.generate({
+            'prompt': prompt,
+            'n': 1,
+            'size': '512x512'
+        })
         
         # Get the image URL
         image_url = response['data'][0]['url']
@@ -59,9 +257,115 @@ def generate_image():
             'error': str(e)
         })
 
+@app.route('/generate_images', methods=['POST'])
+@traced_route
+def generate_images():
+    data = request.json
+    paragraphs = data.get('paragraphs', [])
+    
+    # Same scenes as the PDF uses, so the two share cached illustrations
+    scenes = [illustration_scene(paragraph) for paragraph in paragraphs]
+    images = generator.generate_images(scenes)
+    
+    results = []
+    for paragraph, scene in zip(paragraphs, scenes):
+        image_data = images.get(scene)
+        results.append({
+            'paragraph': paragraph,
+            'success': image_data is not None,
+            'image_url': (
+                f"data:{image_mime_type(image_data)};base64,{base64.b64encode(image_data).decode('ascii')}"
+                if image_data else None
+            )
+        })
+    return jsonify({'images': results})
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        'chat_governor': CHAT_GOVERNOR.stats(),
+        'image_governor': IMAGE_GOVERNOR.stats(),
+        'response_cache': generator.response_cache.stats(),
+        'story_index': generator.story_index.stats(),
+        'job_queue_depth': job_queue.queue_depth(),
+        'surprise_pool': surprise_pool.stats()
+    })
+
+def current_load():
+    """Values read at scrape time: governor load, cache size, queue depth and surprise stock."""
+    governors = [CHAT_GOVERNOR, IMAGE_GOVERNOR]
+    cache = generator.response_cache.stats()
+    surprise = surprise_pool.stats()
+    return [
+        ('openai_in_flight_requests', 'gauge', 'Requests holding a governor slot.',
+         {(('api', g.name),): g.stats()['in_flight'] for g in governors}),
+        ('openai_queued_requests', 'gauge', 'Requests waiting for a governor slot.',
+         {(('api', g.name),): g.stats()['queued'] for g in governors}),
+        ('response_cache_entries', 'gauge', 'Replies held in the in-memory response cache.',
+         {(): cache['entries']}),
+        ('job_queue_depth', 'gauge', 'Story jobs waiting for a worker.',
+         {(): job_queue.queue_depth()}),
+        ('surprise_pool_stock', 'gauge', 'Random stories ready to be served.',
+         {(): surprise['stock']}),
+        ('surprise_pool_misses_total', 'counter', 'Random story requests that found the stock empty.',
+         {(): surprise['misses']}),
+    ]
+
+REGISTRY.add_collector(current_load)
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+# Size of the pieces a PDF is streamed to the client in
+PDF_CHUNK_SIZE = 64 * 1024
+
+def stream_buffer(buffer):
+    """Yield a file-like object's contents in chunks."""
+    return iter(lambda: buffer.read(PDF_CHUNK_SIZE), b'')
+
+@app.route('/generate_pdf', methods=['POST'])
+@traced_route
+def generate_pdf():
+    data = request.json
+    # Render straight into memory and stream it out with chunked transfer. Without
+    # feedback in the request, a story_id picks up the background judge's result.
+    buffer = generator.generate_pdf(
+        data.get('story', ''),
+        data.get('feedback'),
+        data.get('prompt', ''),
+        in_memory=True,
+        story_id=data.get('story_id'),
+        wait_for_judge=data.get('wait_for_judge', True)
+    )
+    return Response(
+        stream_buffer(buffer),
+        mimetype='application/pdf',
+        headers={'Content-Disposition': 'attachment; filename="bedtime_story.pdf"'}
+    )
+
 @app.route('/download_pdf/<filename>')
 def download_pdf(filename):
-    return send_file(filename, as_attachment=True)
+    # Only serve artifacts from the store, never arbitrary paths
+    artifact_id = ArtifactStore.id_from_filename(filename)
+    path = generator.artifact_store.get_path(artifact_id) if artifact_id else None
+    if path is None:
+        return jsonify({'error': 'PDF not found'}), 404
+    
+    # Artifacts are content-addressed and never change, so the ID is a strong ETag.
+    # conditional=True answers If-None-Match with 304 and Range requests with 206.
+    return send_file(
+        path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name='bedtime_story.pdf',
+        conditional=True,
+        etag=artifact_id,
+        max_age=31536000
+    )
 
 if __name__ == '__main__':
+    # With the debug reloader, only the child process that serves requests warms stories
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        surprise_pool.start()
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,78 @@
+import re
+from collections import defaultdict
+
+# Extra request words that point at an arc but don't appear in its themes or description
+ARC_HINTS = {
+    "hero's_journey": ["adventure", "quest", "journey", "hero", "brave", "explore", "treasure", "dragon", "knight",
+                       "wizard", "space", "rescue", "discover"],
+    "friendship": ["friend", "together", "team", "share", "lonely", "new", "kind", "buddy", "pal", "meet"],
+    "three_act": ["mystery", "conflict", "rival", "contest", "race", "competition", "plan", "trouble"],
+    "problem_solution": ["problem", "solve", "fix", "broken", "lost", "find", "help", "invent", "build", "puzzle"],
+    "learning": ["learn", "first", "skill", "practice", "school", "try", "teach", "lesson", "fly", "read", "spell"],
+    "bedtime_gentle": ["bedtime", "sleep", "sleepy", "night", "moon", "star", "dream", "quiet", "calm", "cloud",
+                       "gentle", "soft", "garden", "bed", "lullaby", "cozy"],
+}
+
+# Words that carry no signal about the arc
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "to", "in", "on", "for", "with", "about", "where", "who", "that", "is", "are",
+    "story", "stories", "character", "made", "three", "clear", "part", "simple", "structure", "power",
+    "through", "their", "his", "her", "its", "my", "me", "i", "want", "tell", "please", "some", "can", "how",
+}
+
+THEME_WEIGHT = 3.0
+HINT_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def stem(word: str) -> str:
+    """Very small suffix stripper so 'learning', 'learns' and 'learned' all match 'learn'."""
+    for suffix in ("ing", "ies", "es", "ed", "ly", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            if suffix == "ies":
+                word += "y"
+            break
+    return word
+
+
+def tokenize(text: str) -> list:
+    words = re.findall(r"[a-z]+", text.lower().replace("'s", "").replace("-", " "))
+    return [stem(word) for word in words if word not in STOPWORDS]
+
+
+class ArcClassifier:
+    """Keyword scorer that picks a story arc for a request without calling the model."""
+
+    def __init__(self, story_arcs: dict, hints: dict = ARC_HINTS):
+        self.arc_keys = list(story_arcs)
+        self.weights = defaultdict(dict)
+        for arc_key, arc in story_arcs.items():
+            for text, weight in (
+                (arc["name"], DESCRIPTION_WEIGHT),
+                (arc["description"], DESCRIPTION_WEIGHT),
+                (" ".join(arc["themes"]), THEME_WEIGHT),
+                (" ".join(hints.get(arc_key, [])), HINT_WEIGHT),
+            ):
+                for token in tokenize(text):
+                    arc_weights = self.weights[token]
+                    arc_weights[arc_key] = max(arc_weights.get(arc_key, 0.0), weight)
+
+    def scores(self, user_input: str) -> dict:
+        """Score every arc against the request."""
+        totals = dict.fromkeys(self.arc_keys, 0.0)
+        for token in set(tokenize(user_input)):
+            for arc_key, weight in self.weights.get(token, {}).items():
+                totals[arc_key] += weight
+        return totals
+
+    def classify(self, user_input: str) -> tuple:
+        """Return (arc_key, confidence) for the request.
+
+        Confidence is the winning score's margin over the runner-up, from 0 to 1.
+        """
+        ranked = sorted(self.scores(user_input).items(), key=lambda item: item[1], reverse=True)
+        (best_arc, best_score), (_, runner_up) = ranked[0], ranked[1]
+        if best_score <= 0:
+            return best_arc, 0.0
+        return best_arc, (best_score - runner_up) / best_score
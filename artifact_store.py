@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from file_utils import atomic_write, directory_lock
+
+# Directory generated PDFs are kept in
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "pdf_artifacts")
+# Disk space the PDFs may use before the least recently downloaded ones are removed
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(500 * 1024 * 1024)))
+
+ARTIFACT_SUFFIX = ".pdf"
+METADATA_SUFFIX = ".json"
+ARTIFACT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ArtifactStore:
+    """Content-addressed store for generated PDFs with a disk quota.
+
+    Each PDF is saved as <sha256>.pdf next to a <sha256>.json metadata file.
+    Reading an artifact refreshes its mtime, which drives LRU garbage collection.
+    """
+
+    def __init__(self, directory: str = ARTIFACT_DIR, max_bytes: int = ARTIFACT_MAX_BYTES):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_valid_id(artifact_id: str) -> bool:
+        return bool(ARTIFACT_ID.match(artifact_id))
+
+    @staticmethod
+    def id_from_filename(filename: str):
+        """Artifact ID for a '<id>.pdf' download name, or None if it isn't one."""
+        artifact_id = filename[:-len(ARTIFACT_SUFFIX)] if filename.endswith(ARTIFACT_SUFFIX) else filename
+        return artifact_id if ArtifactStore.is_valid_id(artifact_id) else None
+
+    def path_for(self, artifact_id: str) -> str:
+        if not self.is_valid_id(artifact_id):
+            raise ValueError(f"Invalid artifact ID: {artifact_id!r}")
+        return os.path.join(self.directory, artifact_id + ARTIFACT_SUFFIX)
+
+    def put(self, data: bytes, metadata: dict = None) -> str:
+        """Store a PDF and return its artifact ID (the SHA-256 of its contents)."""
+        artifact_id = hashlib.sha256(data).hexdigest()
+        path = self.path_for(artifact_id)
+        info = dict(metadata or {})
+        info.update({
+            "id": artifact_id,
+            "size": len(data),
+            "content_type": "application/pdf",
+            "created_at": time.time(),
+        })
+        atomic_write(path[:-len(ARTIFACT_SUFFIX)] + METADATA_SUFFIX, json.dumps(info).encode("utf-8"))
+        atomic_write(path, data)
+        self.collect_garbage()
+        return artifact_id
+
+    def get_path(self, artifact_id: str):
+        """Return the file for an artifact and mark it as recently used, or None if missing."""
+        if not self.is_valid_id(artifact_id):
+            return None
+        path = self.path_for(artifact_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def metadata(self, artifact_id: str):
+        if not self.is_valid_id(artifact_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, artifact_id + METADATA_SUFFIX)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def collect_garbage(self):
+        """Remove least recently used PDFs until the store fits in max_bytes."""
+        with self._lock, directory_lock(self.directory):
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(ARTIFACT_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for victim in (path, path[:-len(ARTIFACT_SUFFIX)] + METADATA_SUFFIX):
+                    try:
+                        os.remove(victim)
+                    except FileNotFoundError:
+                        pass
+                total -= size
@@ -0,0 +1,203 @@
+"""Generate stories in bulk from a JSONL file of prompts.
+
+Each input line is a JSON object holding a prompt (the "prompt" field by default)
+and optionally an ID. Every story is written, judged and illustrated, its PDF is
+rendered in a process pool, and one result line per prompt is appended to the
+output file as soon as it is ready. The output doubles as the checkpoint: run the
+same command again after a crash and prompts that already succeeded are skipped.
+
+    python batch.py prompts.jsonl -o stories.jsonl --chat-concurrency 8 --image-concurrency 4
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from main import StoryGenerator, illustration_plan
+from pdf_renderer import render_pdf
+
+logger = logging.getLogger(__name__)
+
+
+def read_prompts(path: str, prompt_field: str, id_field: str) -> list:
+    """Return (id, prompt) for every usable line of the input file."""
+    prompts = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            prompt = record.get(prompt_field)
+            if not prompt:
+                logger.warning(f"Line {line_number} has no {prompt_field!r} field, skipping it")
+                continue
+            prompts.append((str(record.get(id_field, line_number)), prompt))
+    return prompts
+
+
+def completed_ids(path: str) -> set:
+    """IDs that already have a successful result in the output file.
+
+    A line cut short by a crash is ignored, so that prompt is simply generated again.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in result:
+                done.add(result["id"])
+    return done
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class Progress:
+    """Throughput and ETA reporting on stderr."""
+
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def update(self, failed: bool = False):
+        self.done += 1
+        self.failed += failed
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = self.total - self.skipped - self.done
+        eta = remaining / rate if rate else 0.0
+        print(f"[{self.skipped + self.done}/{self.total}] {rate * 60:.1f} stories/min, "
+              f"{self.failed} failed, ETA {int(eta // 60)}m{int(eta % 60):02d}s", file=sys.stderr)
+
+
+def run_batch(args):
+    prompts = read_prompts(args.input, args.prompt_field, args.id_field)
+    done = set() if args.restart else completed_ids(args.output)
+    pending = [item for item in prompts if item[0] not in done]
+    progress = Progress(len(prompts), len(prompts) - len(pending))
+    if not pending:
+        print("Nothing to do: every prompt already has a result", file=sys.stderr)
+        return
+
+    # One image request at a time per image worker, so image_concurrency bounds the total
+    generator = StoryGenerator(image_workers=1)
+    chat_pool = ThreadPoolExecutor(max_workers=args.chat_concurrency, thread_name_prefix="batch-chat")
+    image_pool = ThreadPoolExecutor(max_workers=args.image_concurrency, thread_name_prefix="batch-image")
+    # spawn, not fork: this process is running threads
+    pdf_pool = ProcessPoolExecutor(max_workers=args.pdf_workers,
+                                   mp_context=multiprocessing.get_context("spawn")) if not args.no_pdf else None
+
+    def write_story(item):
+        story, feedback = generator.generate_story(item[1], reuse=args.reuse)
+        if not story:
+            raise RuntimeError("The model returned no story")
+        return story, feedback
+
+    def illustrate(story):
+        scenes = illustration_plan(story)
+        images = generator.generate_images(scenes.values())
+        return {i: images[scene] for i, scene in scenes.items() if scene in images}
+
+    queue = list(reversed(pending))
+    in_flight = {}
+    results = {}
+    mode = "w" if args.restart else "a"
+    with open(args.output, mode) as out:
+        if out.tell() and not _ends_with_newline(args.output):
+            # Start after the line a crash cut short rather than gluing onto it
+            out.write("\n")
+        def finish(item, result=None, error=None):
+            line = {"id": item[0], "prompt": item[1]}
+            if error is not None:
+                line["error"] = error
+            else:
+                line.update(result)
+            # Flushed line by line so a crash loses at most the stories in flight
+            out.write(json.dumps(line) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            progress.update(failed=error is not None)
+
+        def admit():
+            # Keep the chat stage busy without reading the whole file into flight at once
+            while queue and sum(stage == "story" for stage, _ in in_flight.values()) < args.chat_concurrency * 2:
+                item = queue.pop()
+                in_flight[chat_pool.submit(write_story, item)] = ("story", item)
+
+        admit()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, item = in_flight.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    logger.error(f"{item[0]}: {stage} failed: {str(e)}")
+                    results.pop(item[0], None)
+                    finish(item, error=f"{stage}: {e}")
+                    continue
+
+                if stage == "story":
+                    story, feedback = value
+                    results[item[0]] = {"story": story, "feedback": feedback}
+                    if pdf_pool is None:
+                        finish(item, results.pop(item[0]))
+                    else:
+                        in_flight[image_pool.submit(illustrate, story)] = ("images", item)
+                elif stage == "images":
+                    result = results[item[0]]
+                    in_flight[pdf_pool.submit(render_pdf, result["story"], result["feedback"],
+                                              item[1], value)] = ("pdf", item)
+                else:
+                    artifact_id = generator.artifact_store.put(value, {"user_input": item[1]})
+                    result = results.pop(item[0])
+                    result["pdf_filename"] = f"{artifact_id}.pdf"
+                    result["pdf_path"] = generator.artifact_store.path_for(artifact_id)
+                    finish(item, result)
+            admit()
+
+    chat_pool.shutdown()
+    image_pool.shutdown()
+    if pdf_pool is not None:
+        pdf_pool.shutdown()
+    elapsed = time.monotonic() - progress.started
+    print(f"Generated {progress.done - progress.failed} stories ({progress.failed} failed) "
+          f"in {elapsed:.0f}s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file with one prompt per line")
+    parser.add_argument("-o", "--output", default="stories.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--prompt-field", default="prompt", help="input field holding the prompt")
+    parser.add_argument("--id-field", default="id", help="input field holding the ID (default: line number)")
+    parser.add_argument("--chat-concurrency", type=int, default=4, help="stories written at the same time")
+    parser.add_argument("--image-concurrency", type=int, default=4, help="image requests at the same time")
+    parser.add_argument("--pdf-workers", type=int, default=os.cpu_count() or 1, help="PDF rendering processes")
+    parser.add_argument("--no-pdf", action="store_true", help="skip illustrations and PDFs")
+    parser.add_argument("--restart", action="store_true", help="ignore earlier results and start over")
+    parser.add_argument("--reuse", action="store_true",
+                        help="serve stories already written for near-duplicate prompts instead of new ones")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    run_batch(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Cold-start benchmark for the serverless handlers.
+
+Imports each handler in a fresh interpreter with ``-X importtime`` and reports
+the median cumulative import time, plus which of the heavy optional libraries
+got pulled in. Pass ``--against <git rev>`` to run the same measurement on an
+older revision and print both side by side.
+
+    python bench/bench_importtime.py --against HEAD~1
+"""
+import argparse
+import io
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLERS = ["generate_story", "generate_image", "download_pdf"]
+HEAVY_MODULES = ["rich", "reportlab", "PIL", "requests", "dotenv", "openai"]
+IMPORT_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)")
+
+
+def measure(tree: str, module: str, runs: int):
+    """Return (median import time in ms, heavy modules loaded) for one handler."""
+    timings = []
+    loaded = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=tree, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{result.stderr}")
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if not match:
+                continue
+            cumulative, indent, name = match.groups()
+            if name == module and not indent:
+                timings.append(int(cumulative) / 1000)
+            top_level = name.split(".")[0]
+            if top_level in HEAVY_MODULES:
+                loaded.add(top_level)
+    return statistics.median(timings), sorted(loaded)
+
+
+def export_revision(rev: str, dest: str):
+    archive = subprocess.run(["git", "archive", rev], cwd=REPO_ROOT, capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(dest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="imports per handler (median is reported)")
+    parser.add_argument("--against", metavar="REV", help="git revision to compare with")
+    args = parser.parse_args()
+
+    trees = [("current", REPO_ROOT)]
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.against:
+            export_revision(args.against, tmp)
+            trees.insert(0, (args.against, tmp))
+
+        for module in HANDLERS:
+            print(module)
+            for label, tree in trees:
+                median_ms, loaded = measure(tree, module, args.runs)
+                print(f"  {label:>12}: {median_ms:8.1f} ms  loads: {', '.join(loaded) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
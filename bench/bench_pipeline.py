@@ -0,0 +1,247 @@
+"""End-to-end latency and load benchmark against a local fake OpenAI API.
+
+Runs each scenario with the given number of iterations and concurrent callers
+and reports p50/p95/p99 latency, throughput and errors:
+
+    story   StoryGenerator.generate_story (arc, story and judge calls)
+    pdf     StoryGenerator.generate_pdf rendering, illustrations already stored
+    routes  the Flask app under load: /generate_story, /generate_images, /generate_pdf
+
+Caches and story reuse are disabled unless --warm-cache is given, so every
+iteration does the full work. Save a run as a baseline and compare a later revision against it:
+
+    python bench/bench_pipeline.py --save before
+    python bench/bench_pipeline.py --compare before
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+SCENARIOS = ["story", "pdf", "routes"]
+ROUTES = ["generate_story", "generate_images", "generate_pdf"]
+
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_openai
+
+
+def percentile(sorted_values, q: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))]
+
+
+def run_load(call, iterations: int, concurrency: int) -> dict:
+    """Call call(i) for i in range(iterations) from concurrency threads and summarise it."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            call(i)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(iterations)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "wall_seconds": wall,
+    }
+
+
+def configure_environment(api_base: str, workdir: str):
+    """Point the app at the fake API and at scratch storage before it is imported."""
+    os.environ["OPENAI_API_BASE"] = api_base
+    os.environ.setdefault("OPENAI_API_KEY", "bench-chat-key")
+    os.environ.setdefault("IMAGE_GEN_API_KEY", "bench-image-key")
+    os.environ["IMAGE_STORE_DIR"] = os.path.join(workdir, "image_cache")
+    os.environ["ARTIFACT_DIR"] = os.path.join(workdir, "pdf_artifacts")
+    os.environ.pop("RESPONSE_CACHE_DB", None)
+    # No background story warming skewing the numbers (or spending requests)
+    os.environ["SURPRISE_POOL_SIZE"] = "0"
+    # Measure the pipeline, not the production rate limits, unless they are set explicitly
+    for name, value in (("CHAT_RPM", "1000000"), ("CHAT_TPM", "1000000000"), ("IMAGE_RPM", "1000000")):
+        os.environ.setdefault(name, value)
+
+
+def bench_story(args) -> dict:
+    from main import StoryGenerator
+    from response_cache import ResponseCache
+    from story_index import StoryIndex
+
+    if args.warm_cache:
+        generator = StoryGenerator()
+    else:
+        generator = StoryGenerator(response_cache=ResponseCache(max_entries=0), story_index=StoryIndex(max_entries=0))
+    return run_load(lambda i: generator.generate_story(f"A young dragon learning to fly, take {i}"),
+                    args.iterations, args.concurrency)
+
+
+def bench_pdf(args) -> dict:
+    from main import StoryGenerator
+
+    generator = StoryGenerator()
+    story = fake_openai.story_text(args.story_words)
+    feedback = json.loads(fake_openai.judge_text(random.Random(0)))
+    # Render once so the illustrations are in the store and only reportlab is measured
+    generator.generate_pdf(story, feedback, "bench", in_memory=True)
+    return run_load(lambda i: generator.generate_pdf(story, feedback, "bench", in_memory=True),
+                    args.iterations, args.concurrency)
+
+
+def bench_routes(args) -> dict:
+    import requests
+    from werkzeug.serving import make_server
+    import app as flask_app
+    from response_cache import ResponseCache
+    from story_index import StoryIndex
+
+    if not args.warm_cache:
+        flask_app.generator.response_cache = ResponseCache(max_entries=0)
+        flask_app.generator.story_index = StoryIndex(max_entries=0)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, flask_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+    story = fake_openai.story_text(args.story_words)
+
+    def post(path, payload):
+        response = session.post(base + path, json=payload, timeout=600)
+        response.raise_for_status()
+        return response
+
+    bodies = {
+        "generate_story": lambda i: {"prompt": f"A friendly robot making new friends, take {i}"},
+        "generate_images": lambda i: {"paragraphs": [f"Scene {i}: the robot waves hello to a cat."]},
+        "generate_pdf": lambda i: {"story": story, "prompt": "bench", "feedback": {}},
+    }
+    results = {}
+    try:
+        for route in args.routes:
+            results[route] = run_load(lambda i: post(f"/{route}", bodies[route](i)).content,
+                                      args.iterations, args.concurrency)
+    finally:
+        server.shutdown()
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: dict):
+    print(f"{'scenario':<24}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'req/s':>9}{'errors':>8}")
+    for name, summary in results.items():
+        print(f"{name:<24}{summary['p50']:9.3f}{summary['p95']:9.3f}{summary['p99']:9.3f}"
+              f"{summary['throughput']:9.2f}{summary['errors']:8d}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Print changes against a baseline; return True if anything regressed beyond tolerance."""
+    regressed = False
+    print(f"\nAgainst baseline from {baseline['revision']} ({baseline['created_at']}):")
+    for name, summary in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        for key, higher_is_worse in (("p50", True), ("p95", True), ("throughput", False)):
+            if not before[key]:
+                continue
+            change = (summary[key] - before[key]) / before[key]
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            regressed |= worse
+            print(f"  {name:<22}{key:>11}: {before[key]:9.3f} -> {summary[key]:9.3f} "
+                  f"({change:+.1%}){'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"any of {', '.join(SCENARIOS)} (default all)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=ROUTES)
+    parser.add_argument("--warm-cache", action="store_true", help="leave the response cache and story reuse on")
+    parser.add_argument("--save", metavar="NAME", help="save the results as bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with bench/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative change counted as a regression (default 0.10)")
+    fake_openai.add_arguments(parser)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.ERROR)
+    fake = fake_openai.from_arguments(args).start()
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(fake.api_base, workdir)
+        for scenario in args.scenarios or SCENARIOS:
+            if scenario == "routes":
+                results.update({f"route:{route}": summary for route, summary in bench_routes(args).items()})
+            else:
+                results[scenario] = {"story": bench_story, "pdf": bench_pdf}[scenario](args)
+    fake.stop()
+
+    print_results(results)
+    print(f"\nFake API: {fake.requests} requests, {fake.errors} injected errors")
+
+    run = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        "results": results,
+    }
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f"{args.save}.json"), "w") as f:
+            json.dump(run, f, indent=2)
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            if compare(results, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
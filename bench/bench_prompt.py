@@ -0,0 +1,39 @@
+"""Micro-benchmark for story prompt construction.
+
+Compares building a prompt from the precompiled (arc, age category) parts with
+compiling the arc structure and instruction text from scratch, which is what
+every request used to do.
+
+    python bench/bench_prompt.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from story_arcs import STORY_ARCS, DEFAULT_AGE_CATEGORY
+from prompts import compile_story_prompt, story_prompt
+
+USER_INPUT = "A young dragon learning to fly"
+NUMBER = 20000
+
+
+def from_scratch():
+    head, tail = compile_story_prompt(STORY_ARCS["hero's_journey"], DEFAULT_AGE_CATEGORY)
+    return head + USER_INPUT + tail
+
+
+def precompiled():
+    return story_prompt("hero's_journey", DEFAULT_AGE_CATEGORY, USER_INPUT)
+
+
+def main():
+    assert from_scratch() == precompiled()
+    for name, func in (("from scratch", from_scratch), ("precompiled", precompiled)):
+        best = min(timeit.repeat(func, number=NUMBER, repeat=5))
+        print(f"{name:>12}: {best / NUMBER * 1e6:8.2f} µs per prompt")
+
+
+if __name__ == "__main__":
+    main()
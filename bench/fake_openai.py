@@ -0,0 +1,224 @@
+"""Local stand-in for the OpenAI chat and image endpoints, for offline benchmarks.
+
+Replies are canned but shaped like the real ones (story text, judge JSON, arc
+names, outlines, b64 images, SSE streams), and every call can be slowed down
+and made to fail in a reproducible way:
+
+    python bench/fake_openai.py --port 8001 --chat-latency 0.5 --token-rate 60 --error-rate 0.05
+
+then point the app at it with OPENAI_API_BASE=http://127.0.0.1:8001/v1.
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+STORY_PARAGRAPH = (
+    "Luna the little owl peered out of her hollow as the moon rose over Whispering Wood. "
+    "The air smelled of pine and rain, and somewhere below a brook was humming a sleepy tune. "
+    "\"Tonight,\" she whispered to her friend Pip the hedgehog, \"we find the lost star.\""
+)
+
+
+def story_text(words: int) -> str:
+    """A story of about the given number of words, in paragraphs like a real reply."""
+    per_paragraph = len(STORY_PARAGRAPH.split())
+    return "\n\n".join(STORY_PARAGRAPH for _ in range(max(1, words // per_paragraph)))
+
+
+def judge_text(rng: random.Random) -> str:
+    keys = ["age_appropriateness", "story_structure", "educational_value", "entertainment_value",
+            "language_clarity", "length_appropriateness", "emotional_tone", "character_development",
+            "setting_atmosphere", "dialogue_quality", "sensory_details", "overall_score"]
+    feedback = {key: rng.randint(6, 10) for key in keys}
+    feedback["suggestions"] = "Add a little more dialogue between Luna and Pip."
+    return json.dumps(feedback)
+
+
+def placeholder_png(size: int) -> bytes:
+    """A noisy PNG about the size and weight of a real illustration."""
+    from PIL import Image
+    image = Image.effect_noise((size, size), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class FakeOpenAI:
+    """Threaded HTTP server answering /v1/chat/completions and /v1/images/generations.
+
+    Each chat reply takes chat_latency plus completion tokens / token_rate seconds;
+    each image request takes image_latency. A seeded error_rate fraction of requests
+    fail with 429 (with Retry-After) or 500. The bearer key of every request is
+    counted per endpoint in keys_seen and echoed in JSON replies as "authorization".
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, chat_latency: float = 0.2,
+                 token_rate: float = 0.0, image_latency: float = 0.5, error_rate: float = 0.0,
+                 story_words: int = 1700, image_size: int = 1024, seed: int = 0):
+        self.chat_latency = chat_latency
+        self.token_rate = token_rate
+        self.image_latency = image_latency
+        self.error_rate = error_rate
+        self.story_words = story_words
+        self.image_b64 = base64.b64encode(placeholder_png(image_size)).decode("ascii")
+        self.requests = 0
+        self.errors = 0
+        self.keys_seen = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-openai", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _roll(self):
+        """Count a request and decide, reproducibly, whether it fails and how."""
+        with self._lock:
+            self.requests += 1
+            if self._rng.random() < self.error_rate:
+                self.errors += 1
+                return self._rng.choice([429, 500]), None
+            return None, random.Random(self._rng.random())
+
+    def chat_reply(self, prompt: str, rng: random.Random) -> str:
+        if prompt.startswith("Evaluate"):
+            return judge_text(rng)
+        if prompt.startswith("Based on this story request"):
+            return rng.choice(["hero's_journey", "friendship", "three_act", "learning"])
+        if prompt.startswith("Plan"):
+            stages = re.findall(r"^\n?(.+):\nPurpose:", prompt, re.M)
+            return json.dumps({
+                "title": "Luna and the Lost Star",
+                "setting": "Whispering Wood on a moonlit autumn night.",
+                "characters": [{"name": "Luna", "appearance": "a small grey owl", "personality": "curious",
+                                "way_of_speaking": "softly"}],
+                "lesson": "Friends make brave things possible.",
+                "sections": [{"stage": stage, "summary": f"Luna and Pip reach the {stage} part."} for stage in stages],
+            })
+        if prompt.startswith("These are the boundaries"):
+            return json.dumps(["Night deepened as they went on."] * prompt.count("Boundary "))
+        if prompt.startswith("You are writing one part"):
+            match = re.search(r"About (\d+) words", prompt)
+            return story_text(int(match.group(1)) if match else 300)
+        return story_text(self.story_words)
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                self.api_key = self.headers.get("Authorization", "").replace("Bearer ", "", 1)
+                with fake._lock:
+                    fake.keys_seen[(self.path.rsplit("/v1/", 1)[-1], self.api_key)] += 1
+                status, rng = fake._roll()
+                if status:
+                    self._send_json({"error": {"message": "simulated failure"}}, status,
+                                    {"Retry-After": "0.1"} if status == 429 else None)
+                elif self.path.endswith("/chat/completions"):
+                    self._chat(body, rng)
+                elif self.path.endswith("/images/generations"):
+                    time.sleep(fake.image_latency)
+                    self._send_json({"data": [{"b64_json": fake.image_b64, "url": "http://fake/image.png"}]
+                                     * body.get("n", 1), "authorization": self.api_key})
+                else:
+                    self._send_json({"error": {"message": "not found"}}, 404)
+
+            def _chat(self, body, rng):
+                prompt = body["messages"][0]["content"]
+                text = fake.chat_reply(prompt, rng)
+                completion_tokens = max(1, len(text) // 4)
+                per_token = 1 / fake.token_rate if fake.token_rate else 0.0
+                time.sleep(fake.chat_latency)
+                if not body.get("stream"):
+                    time.sleep(completion_tokens * per_token)
+                    self._send_json({
+                        "choices": [{"message": {"role": "assistant", "content": text}}],
+                        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": completion_tokens,
+                                  "total_tokens": len(prompt) // 4 + completion_tokens},
+                        "authorization": self.api_key,
+                    })
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = text.split(" ")
+                for word in words:
+                    # Roughly one token per word piece of 4 characters
+                    time.sleep(per_token * max(1, len(word) // 4))
+                    self._chunk(f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n")
+                self._chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, text):
+                data = text.encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+            def _send_json(self, payload, status=200, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="seconds before each chat reply")
+    parser.add_argument("--token-rate", type=float, default=0.0,
+                        help="completion tokens per second (0 = instant)")
+    parser.add_argument("--image-latency", type=float, default=0.5, help="seconds per image request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 429/500")
+    parser.add_argument("--story-words", type=int, default=1700, help="length of generated stories")
+    parser.add_argument("--seed", type=int, default=0, help="seed for scores and injected errors")
+
+
+def from_arguments(args, port: int = 0) -> FakeOpenAI:
+    return FakeOpenAI(port=port, chat_latency=args.chat_latency, token_rate=args.token_rate,
+                      image_latency=args.image_latency, error_rate=args.error_rate,
+                      story_words=args.story_words, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    add_arguments(parser)
+    args = parser.parse_args()
+    fake = from_arguments(args, args.port)
+    print(f"Fake OpenAI API listening on {fake.api_base}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
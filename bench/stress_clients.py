@@ -0,0 +1,119 @@
+"""Stress test for cross-talk between the chat and image API clients.
+
+Many threads send chat and image requests at the same time against the local
+fake API, which echoes back the key each request carried:
+
+    shared   the generator's own chat_client and image_client, used through
+             call_model and image generation as the app does
+    private  a ChatClient and ImageClient per thread with keys of its own, all
+             sharing one transport (and so one connection pool)
+
+Every reply must carry the key of the client that sent it, and the fake server
+must only ever have seen chat keys on the chat endpoint and image keys on the
+image endpoint. Exits with status 1 on any mismatch:
+
+    python bench/stress_clients.py --threads 32 --iterations 50
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_openai
+from bench_pipeline import configure_environment
+
+CHAT_KEY = "stress-chat-key"
+IMAGE_KEY = "stress-image-key"
+IMAGE_PAYLOAD = {"prompt": "A lighthouse made of cake", "n": 1, "size": "512x512", "response_format": "b64_json"}
+
+
+def chat_payload(thread: int, i: int) -> dict:
+    return {"model": "gpt-3.5-turbo", "max_tokens": 10,
+            "messages": [{"role": "user", "content": f"Based on this story request: thread {thread}, call {i}"}]}
+
+
+def run(args) -> list:
+    from main import StoryGenerator
+    from response_cache import ResponseCache
+    from transport import ChatClient, ImageClient
+
+    generator = StoryGenerator(response_cache=ResponseCache(max_entries=0))
+    try:
+        generator.chat_client.api_key = "swapped"
+        return ["ChatClient.api_key could be reassigned"]
+    except AttributeError:
+        pass
+
+    failures = []
+    lock = threading.Lock()
+
+    def check(what: str, expected: str, reply: dict):
+        if reply.get("authorization") != expected:
+            with lock:
+                failures.append(f"{what}: sent with {expected!r}, server saw {reply.get('authorization')!r}")
+
+    def worker(thread: int):
+        chat = ChatClient(generator.transport, f"chat-{thread}")
+        image = ImageClient(generator.transport, f"image-{thread}")
+        for i in range(args.iterations):
+            # Interleave the four kinds of call so chat and image requests overlap constantly
+            check("private chat", chat.api_key, chat.complete(chat_payload(thread, i)))
+            check("private image", image.api_key, image.generate(IMAGE_PAYLOAD))
+            check("shared chat", CHAT_KEY, generator.chat_client.complete(chat_payload(thread, i)))
+            check("shared image", IMAGE_KEY, generator.image_client.generate(IMAGE_PAYLOAD))
+            # The generator's own call paths; checked through the server's tally below
+            generator.call_model(f"Based on this story request: pipeline {thread}/{i}", max_tokens=10,
+                                 use_cache=False)
+            if not generator._request_images(f"pipeline {thread}/{i}", 1):
+                with lock:
+                    failures.append("pipeline image request failed")
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(worker, range(args.threads)))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds the fake API takes per request")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    fake = fake_openai.FakeOpenAI(chat_latency=args.latency, image_latency=args.latency, image_size=64).start()
+    os.environ["OPENAI_API_KEY"] = CHAT_KEY
+    os.environ["IMAGE_GEN_API_KEY"] = IMAGE_KEY
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(fake.api_base, workdir)
+        failures = run(args)
+    elapsed = time.perf_counter() - started
+    fake.stop()
+
+    chat_keys = {CHAT_KEY} | {f"chat-{t}" for t in range(args.threads)}
+    image_keys = {IMAGE_KEY} | {f"image-{t}" for t in range(args.threads)}
+    for (endpoint, key), count in sorted(fake.keys_seen.items()):
+        allowed = chat_keys if endpoint == "chat/completions" else image_keys
+        if key not in allowed:
+            failures.append(f"{endpoint} received {count} requests with {key!r}")
+
+    print(f"{fake.requests} requests from {args.threads} threads in {elapsed:.1f}s")
+    for failure in failures[:20]:
+        print(f"  {failure}")
+    if failures:
+        print(f"FAILED: {len(failures)} mismatches")
+        sys.exit(1)
+    print("OK: every request carried its own client's key")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,108 @@
 import os
+import re
+
+from artifact_store import ArtifactStore
+
+# Size of the pieces the PDF is streamed to the client in
+CHUNK_SIZE = 64 * 1024
+
+_artifact_store = None
+
+def get_artifact_store():
+    """The artifact store, created on the first request so a cold start never writes to disk."""
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore()
+    return _artifact_store
+
+def read_chunks(filename, start=0, length=None):
+    """Yield length bytes of a file (the rest of it by default) from start, in chunks."""
+    with open(filename, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+def etag_matches(header, etag):
+    """Whether an If-None-Match header matches etag: '*', or any tag in the list, weak or not."""
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in header.split(",")]
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+def parse_range(header, size):
+    """(start, end) of a single 'bytes=' range, end inclusive; None to serve the whole file.
+
+    Malformed and multi-part ranges are ignored, as the spec allows. Raises ValueError
+    for a range that starts past the end of the file.
+    """
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header or "")
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # The last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range starts past the end of the file")
+    return start, end
 
 def handler(request, response):
     filename = request.path_params[0]  # from /download_pdf/(.*)
-    if os.path.exists(filename):
-        with open(filename, "rb") as f:
-            response.body = f.read()
-        response.headers["Content-Type"] = "application/pdf"
-        response.status_code = 200
-    else:
+    artifact_store = get_artifact_store()
+    # Only serve artifacts from the store, never arbitrary paths
+    artifact_id = ArtifactStore.id_from_filename(filename)
+    path = artifact_store.get_path(artifact_id) if artifact_id else None
+    if path is None:
         response.body = b"File not found"
-        response.status_code = 404
\ No newline at end of file
+        response.status_code = 404
+        return
+    
+    # Artifacts are content-addressed and never change, so the ID is a strong ETag
+    etag = f'"{artifact_id}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.headers["Accept-Ranges"] = "bytes"
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        response.body = b""
+        response.status_code = 304
+        return
+    
+    size = os.path.getsize(path)
+    byte_range = None
+    # With If-Range, only resume if the client's copy is this same artifact
+    if request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except ValueError:
+            response.body = b""
+            response.headers["Content-Range"] = f"bytes */{size}"
+            response.status_code = 416
+            return
+    
+    # Stream the file rather than loading it into memory in one go
+    response.headers["Content-Type"] = "application/pdf"
+    if byte_range is None:
+        response.body = read_chunks(path)
+        response.headers["Content-Length"] = str(size)
+        response.status_code = 200
+        return
+    start, end = byte_range
+    response.body = read_chunks(path, start, end - start + 1)
+    response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response.headers["Content-Length"] = str(end - start + 1)
+    response.status_code = 206
@@ -0,0 +1,37 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: directory locks are then a no-op across processes
+    fcntl = None
+
+LOCK_FILENAME = ".lock"
+TEMP_SUFFIX = ".tmp"
+
+
+def atomic_write(path: str, data: bytes):
+    """Write data to path so readers only ever see the old or the complete new file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=TEMP_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def directory_lock(directory: str):
+    """Exclusive lock on a directory, shared between processes through a lock file."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, LOCK_FILENAME), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
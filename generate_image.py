@@ -1,11 +1,15 @@
 import json
+import os
 from main import StoryGenerator
 
+# Created once per container and reused by every warm invocation; like the story
+# handler, it never starts a PDF process pool unless asked to
+generator = StoryGenerator(pdf_backend=os.getenv("PDF_RENDER_BACKEND", "inline"))
+
 def handler(request, response):
     try:
         data = request.json()
         prompt = data.get("prompt", "")
-        generator = StoryGenerator()
         image_filename = generator.generate_image(prompt)
         # You may want to serve the image as a URL or base64 string
         response.body = json.dumps({
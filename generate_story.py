@@ -1,11 +1,15 @@
 import json
+import os
 from main import StoryGenerator
 
+# Created once per container and reused by every warm invocation. PDFs are laid out
+# inline: a process pool per short-lived container costs more than it saves.
+generator = StoryGenerator(pdf_backend=os.getenv("PDF_RENDER_BACKEND", "inline"))
+
 def handler(request, response):
     try:
         data = request.json()
         prompt = data.get("prompt", "")
-        generator = StoryGenerator()
         story, feedback = generator.generate_story(prompt)
         # Optionally, generate PDF here if you want
         pdf_filename = generator.generate_pdf(story, feedback, prompt)
@@ -0,0 +1,52 @@
+import os
+import re
+
+from story_index import STOPWORDS
+
+# Scenes at least this similar (word-set Jaccard, 0-1) share one image request
+IMAGE_BATCH_SIMILARITY = float(os.getenv("IMAGE_BATCH_SIMILARITY", "0.6"))
+# Most images asked for in one request (the API allows up to 10)
+IMAGE_BATCH_MAX = int(os.getenv("IMAGE_BATCH_MAX", "10"))
+# Scenes with fewer content words than this are always requested on their own,
+# since a short line ("The end.") says too little to tell whether two scenes match
+IMAGE_BATCH_MIN_WORDS = int(os.getenv("IMAGE_BATCH_MIN_WORDS", "6"))
+
+
+def scene_words(scene_description: str, prefix: str = "") -> frozenset:
+    """Content words of a scene, ignoring a prompt prefix every scene shares."""
+    if prefix and scene_description.startswith(prefix):
+        scene_description = scene_description[len(prefix):]
+    return frozenset(word for word in re.findall(r"[a-z0-9]+", scene_description.lower())
+                     if word not in STOPWORDS)
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def group_scenes(scene_descriptions, threshold: float = IMAGE_BATCH_SIMILARITY,
+                 max_batch: int = IMAGE_BATCH_MAX, min_words: int = IMAGE_BATCH_MIN_WORDS,
+                 prefix: str = "") -> list:
+    """Split scenes into batches that can share one n>1 image request.
+
+    The API renders every image in a request from the same prompt, so a scene only
+    joins a batch if its content words (after prefix) are close enough to the batch's
+    first scene's; short scenes and anything else end up in a batch of their own and
+    are requested individually.
+    """
+    batches = []
+    for scene in scene_descriptions:
+        words = scene_words(scene, prefix)
+        if len(words) >= min_words:
+            for batch in batches:
+                if (len(batch[1]) < max_batch and len(batch[0]) >= min_words
+                        and similarity(batch[0], words) >= threshold):
+                    batch[1].append(scene)
+                    break
+            else:
+                batches.append((words, [scene]))
+        else:
+            batches.append((words, [scene]))
+    return [scenes for _, scenes in batches]
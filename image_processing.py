@@ -0,0 +1,72 @@
+import logging
+import os
+from io import BytesIO
+
+IMAGE_SUFFIXES = {"JPEG": ".jpg", "PNG": ".png"}
+# Other spellings accepted for IMAGE_FORMAT
+IMAGE_FORMAT_ALIASES = {"JPG": "JPEG"}
+
+# Format illustrations are stored and embedded in: JPEG (progressive) or PNG (optimised)
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").strip().upper()
+IMAGE_FORMAT = IMAGE_FORMAT_ALIASES.get(IMAGE_FORMAT, IMAGE_FORMAT)
+if IMAGE_FORMAT not in IMAGE_SUFFIXES:
+    raise ValueError(f"IMAGE_FORMAT must be one of {', '.join(IMAGE_SUFFIXES)}, not {IMAGE_FORMAT!r}")
+
+# JPEG quality, 1-95
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+# Print resolution the illustrations are resampled for
+IMAGE_DPI = int(os.getenv("IMAGE_DPI", "150"))
+# Width and height illustrations are drawn at in the PDF, in points
+PDF_IMAGE_POINTS = 400
+
+logger = logging.getLogger(__name__)
+
+
+def target_pixels(size_points: float = PDF_IMAGE_POINTS, dpi: int = IMAGE_DPI) -> int:
+    """Pixels needed to print size_points (1/72 inch) at dpi."""
+    return round(size_points / 72 * dpi)
+
+
+def optimize_image(data: bytes, size_points: float = PDF_IMAGE_POINTS, dpi: int = IMAGE_DPI,
+                   image_format: str = IMAGE_FORMAT, quality: int = IMAGE_QUALITY) -> bytes:
+    """Downscale an image to what the PDF needs and recompress it.
+
+    Images are only ever scaled down. If the image is already in the target format
+    and recompressing doesn't make it smaller, the original bytes are returned.
+    """
+    from PIL import Image
+
+    try:
+        image = Image.open(BytesIO(data))
+        image.load()
+        source_format = image.format
+    except Exception as e:
+        logger.warning(f"Could not read image for optimisation: {str(e)}")
+        return data
+
+    limit = target_pixels(size_points, dpi)
+    if max(image.size) > limit:
+        image.thumbnail((limit, limit), Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+    if image_format == "JPEG":
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no transparency, so flatten onto white like the page behind it
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.split()[-1])
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(output, "PNG", optimize=True)
+
+    optimized = output.getvalue()
+    if source_format == image_format and len(optimized) >= len(data):
+        return data
+    return optimized
+
+
+def image_mime_type(data: bytes) -> str:
+    """MIME type of stored image bytes, from their signature."""
+    return "image/jpeg" if data[:2] == b"\xff\xd8" else "image/png"
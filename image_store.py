@@ -0,0 +1,146 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from file_utils import atomic_write, directory_lock, TEMP_SUFFIX
+
+# Directory holding the cached illustrations, shared by every process on the machine.
+# Set it to an empty string to keep images in memory only (e.g. on read-only containers)
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "image_cache")
+# Total size the cache may grow to before the least recently used images are removed
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+def normalize_scene(scene_description: str) -> str:
+    """Canonical form of a scene description, so trivial differences share a cache entry."""
+    text = re.sub(r"\s+", " ", scene_description.lower()).strip()
+    return text.strip(" .,!?;:\"'")
+
+
+def scene_key(scene_description: str) -> str:
+    return hashlib.sha256(normalize_scene(scene_description).encode("utf-8")).hexdigest()
+
+
+class ImageStore:
+    """Content-addressed, size-bounded image cache, on disk or in memory.
+
+    Files are named by the hash of the normalised scene description and written
+    atomically, so any number of threads and processes can share one directory.
+    A file's mtime doubles as its last-used time for LRU eviction. Without a
+    directory the images are kept in process memory under the same byte budget.
+    """
+
+    def __init__(self, directory: str = IMAGE_STORE_DIR, max_bytes: int = IMAGE_STORE_MAX_BYTES,
+                 suffix: str = ".png"):
+        self.directory = directory or None
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def path_for(self, scene_description: str):
+        """File the scene's image is stored in, or None for an in-memory store."""
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, scene_key(scene_description) + self.suffix)
+
+    def get(self, scene_description: str):
+        """Return the cached image bytes for a scene, or None."""
+        if not self.directory:
+            key = scene_key(scene_description)
+            with self._lock:
+                if key not in self._memory:
+                    return None
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self.path_for(scene_description)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, scene_description: str, data: bytes):
+        """Store image bytes for a scene."""
+        if not self.directory:
+            key = scene_key(scene_description)
+            with self._lock:
+                if key in self._memory:
+                    self._memory_bytes -= len(self._memory.pop(key))
+                self._memory[key] = data
+                self._memory_bytes += len(data)
+                while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+                    self._memory_bytes -= len(self._memory.popitem(last=False)[1])
+            return
+
+        # Created on first write, so building a store never touches a read-only filesystem
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self.path_for(scene_description), data)
+        self.evict()
+
+    def get_or_create(self, scene_description: str, create):
+        """Return the image bytes for a scene, calling create() for them on a miss.
+
+        Concurrent callers in this process asking for the same scene wait for a single
+        create() rather than each generating it.
+        """
+        data = self.get(scene_description)
+        if data:
+            return data
+        with self._key_lock(scene_key(scene_description)):
+            data = self.get(scene_description)
+            if data:
+                return data
+            data = create()
+            if data:
+                self.put(scene_description, data)
+            return data
+
+    def evict(self):
+        """Delete least recently used images until the store fits in max_bytes."""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, directory_lock(self.directory):
+            entries = []
+            for entry in os.scandir(self.directory):
+                # Count every stored image, including ones left over from another format setting
+                if entry.is_file() and not entry.name.startswith(".") and not entry.name.endswith(TEMP_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    @contextmanager
+    def _key_lock(self, key: str):
+        with self._lock:
+            lock, users = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, users = self._key_locks[key]
+                if users == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (lock, users - 1)
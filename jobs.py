@@ -0,0 +1,137 @@
+import os
+import queue
+import threading
+import time
+import uuid
+
+import tracing
+from main import PDF_IN_MEMORY
+
+# Number of stories generated at the same time in the background
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Maximum number of jobs waiting for a worker before new submissions are refused
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "20"))
+# How long finished jobs are kept around for polling
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+STAGES = ["selecting_arc", "writing_story", "judging", "building_pdf"]
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    def __init__(self, user_input: str, reuse: bool = True):
+        self.id = uuid.uuid4().hex
+        self.user_input = user_input
+        self.reuse = reuse
+        self.status = "queued"
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.request_id = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+
+    def publish(self, event: str, value):
+        """Let pollers read the story while it is being judged and illustrated."""
+        if event == "story":
+            self.result = value
+
+    def to_dict(self) -> dict:
+        """Describe the job for the polling endpoint."""
+        info = {
+            "job_id": self.id,
+            "request_id": self.request_id,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": STAGES,
+            "progress": STAGES.index(self.stage) / len(STAGES) if self.stage in STAGES else 0.0,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if self.result is not None:
+            info["result"] = self.result
+        if self.status == "done":
+            info["progress"] = 1.0
+        if self.error:
+            info["error"] = self.error
+        return info
+
+
+class JobQueue:
+    """Runs the StoryGenerator pipeline on a pool of background worker threads."""
+
+    def __init__(self, generator, workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE,
+                 ttl: float = JOB_TTL_SECONDS):
+        self.generator = generator
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._worker, name=f"story-job-{i}", daemon=True).start()
+
+    def submit(self, user_input: str, reuse: bool = True) -> Job:
+        """Queue a story request and return its job right away.
+
+        With reuse, a story already written for a nearly identical prompt is served.
+        """
+        self._expire()
+        job = Job(user_input, reuse)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFullError("Too many stories are being generated, please try again shortly")
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str):
+        """Return the job with the given ID, or None if it is unknown or expired."""
+        self._expire()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _expire(self):
+        """Drop finished jobs older than the TTL."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job.finished_at is not None and job.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job):
+        with tracing.span("job", job_id=job.id) as span:
+            job.request_id = span.trace_id
+            self._run_pipeline(job)
+            span.set(status=job.status)
+
+    def _run_pipeline(self, job: Job):
+        job.status = "running"
+        try:
+            job.result = self.generator.run_story_request(
+                job.user_input, reuse=job.reuse, with_pdf=not PDF_IN_MEMORY,
+                on_stage=job.set_stage, on_event=job.publish
+            )
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
@@ -1,448 +1,205 @@
 import os
-import openai
+import logging
 from dotenv import load_dotenv
-from rich.console import Console
-from rich.panel import Panel
-from rich.markdown import Markdown
 import json
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
-from reportlab.lib.units import inch
-from datetime import datetime
-import random
-import requests
-from PIL import Image as PILImage
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+import uuid
+import threading
+from collections import OrderedDict
 import base64
+from io import BytesIO
+from response_cache import ResponseCache
+from story_index import StoryIndex
+from arc_classifier import ArcClassifier
+from story_arcs import STORY_ARCS, DEFAULT_AGE_CATEGORY
+from prompts import story_prompt, outline_prompt, section_prompt, continuity_prompt
+from transport import OpenAITransport, ChatClient, ImageClient, estimate_tokens
+from image_store import ImageStore
+from image_processing import optimize_image, IMAGE_FORMAT, IMAGE_SUFFIXES
+from image_batching import group_scenes
+from artifact_store import ArtifactStore
+from pdf_renderer import render_pdf
+from pdf_pool import PDF_RENDER_BACKEND, PdfRenderPool, PdfPoolError, get_pdf_pool
+from metrics import stage_timer, STAGE_ERRORS, MODEL_TOKENS, CACHE_LOOKUPS
+import tracing
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 IMAGE_GEN_API_KEY = os.getenv("IMAGE_GEN_API_KEY") 
-console = Console()
+# Maximum number of illustrations generated at the same time for one PDF
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+CHAT_MODEL = "gpt-3.5-turbo"
+# Calls above this temperature skip the response cache by default, since we want varied output
+CACHE_MAX_TEMPERATURE = float(os.getenv("CACHE_MAX_TEMPERATURE", "0.5"))
+# Background judge calls run on this many threads
+JUDGE_WORKERS = int(os.getenv("JUDGE_WORKERS", "4"))
+# Number of background judge results kept for lookup by story ID
+JUDGE_RESULTS_MAX = int(os.getenv("JUDGE_RESULTS_MAX", "1000"))
+# Story candidates written in parallel by generate_best_story
+BEST_OF_N = int(os.getenv("BEST_OF_N", "3"))
+# Worst-case tokens (prompts plus max_tokens replies) best-of-N may spend on one request
+BEST_OF_TOKEN_BUDGET = int(os.getenv("BEST_OF_TOKEN_BUDGET", "40000"))
+# Stop waiting for the other candidates once one scores at least this
+BEST_OF_TARGET_SCORE = float(os.getenv("BEST_OF_TARGET_SCORE", "9"))
+# max_tokens for model calls that don't ask for a limit of their own
+DEFAULT_MAX_TOKENS = 3000
+# How write_story writes: "single" asks for the whole story in one completion, "outline"
+# plans it first and writes every stage of the arc in parallel
+STORY_MODE = os.getenv("STORY_MODE", "single")
+# max_tokens for the short continuity pass that joins outlined sections
+CONTINUITY_MAX_TOKENS = 400
+# Render PDFs in memory and stream them to the client instead of writing them to disk
+PDF_IN_MEMORY = os.getenv("PDF_IN_MEMORY", "").lower() in ("1", "true", "yes")
+# Below this classifier confidence the model is asked to pick the story arc
+ARC_CONFIDENCE_THRESHOLD = float(os.getenv("ARC_CONFIDENCE_THRESHOLD", "0.3"))
+logger = logging.getLogger(__name__)
+
+# rich and reportlab are imported on first use so the serverless handlers,
+# which never print to a terminal and rarely build PDFs, start faster
+_console = None
+
+def get_console():
+    """Return the shared rich console, creating it on first use."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+# The arc classifier only depends on the shared arc registry, so build it once
+ARC_CLASSIFIER = ArcClassifier(STORY_ARCS)
+
+# Start of every illustration_scene; image batching compares what follows it
+ILLUSTRATION_PREFIX = "Children's book illustration of: "
+
+def illustration_scene(paragraph: str) -> str:
+    """Scene description used to illustrate a story paragraph."""
+    return f"{ILLUSTRATION_PREFIX}{paragraph[:200]}"
+
+def illustration_plan(story: str) -> dict:
+    """Map the indexes of the paragraphs to illustrate to their scene descriptions.
+
+    Every third paragraph gets a picture, to avoid too many images.
+    """
+    return {
+        i: illustration_scene(paragraph)
+        for i, paragraph in enumerate(story.split('\n\n'))
+        if paragraph.strip() and i % 3 == 0
+    }
+
+class StoryWriteError(Exception):
+    """Raised when the model returns no story for a request."""
 
 class StoryGenerator:
-    def __init__(self):
+    def __init__(self, image_workers: int = IMAGE_WORKERS, response_cache: ResponseCache = None,
+                 transport: OpenAITransport = None, image_store: ImageStore = None,
+                 artifact_store: ArtifactStore = None, pdf_pool: PdfRenderPool = None,
+                 story_index: StoryIndex = None, chat_client: ChatClient = None, image_client: ImageClient = None,
+                 pdf_backend: str = PDF_RENDER_BACKEND):
         self.story_history = []
-        self.story_arcs = {
-            "hero's_journey": {
-                "name": "Hero's Journey",
-                "stages": [
-                    {
-                        "name": "Ordinary World",
-                        "description": "Introduce the character in their normal, everyday life",
-                        "emotional_tone": "comfortable, familiar",
-                        "age_adaptations": {
-                            "5-6": "Show simple daily routine (playing, eating, sleeping)",
-                            "7-8": "Include family, friends, and favorite activities",
-                            "9-10": "Add personality traits and small challenges"
-                        }
-                    },
-                    {
-                        "name": "Call to Adventure",
-                        "description": "Something happens that starts the adventure",
-                        "emotional_tone": "exciting, curious",
-                        "age_adaptations": {
-                            "5-6": "Simple discovery (lost toy, new friend)",
-                            "7-8": "Invitation to help someone or explore somewhere",
-                            "9-10": "Mystery to solve or challenge to accept"
-                        }
-                    },
-                    {
-                        "name": "Journey Begins",
-                        "description": "Character starts their adventure",
-                        "emotional_tone": "determined, hopeful",
-                        "age_adaptations": {
-                            "5-6": "Taking first steps with excitement",
-                            "7-8": "Planning and preparing for the journey",
-                            "9-10": "Showing courage despite uncertainty"
-                        }
-                    },
-                    {
-                        "name": "Challenges and Helpers",
-                        "description": "Character faces specific obstacles and meets helpers",
-                        "emotional_tone": "challenging but hopeful",
-                        "age_adaptations": {
-                            "5-6": "Simple problems with friendly helpers",
-                            "7-8": "Puzzles to solve with teammates",
-                            "9-10": "Complex challenges requiring multiple attempts"
-                        },
-                        "specific_requirements": {
-                            "challenges": [
-                                "Physical obstacle (bridge, mountain, river)",
-                                "Mental challenge (riddle, puzzle, test)",
-                                "Emotional challenge (fear, doubt, loneliness)"
-                            ],
-                            "helpers": [
-                                "Wise mentor with specific knowledge",
-                                "Loyal friend with unique skills",
-                                "Unexpected ally with special abilities"
-                            ],
-                            "interactions": [
-                                "Show how each helper is met",
-                                "Describe their unique appearance and personality",
-                                "Explain how they help with specific challenges"
-                            ]
-                        }
-                    },
-                    {
-                        "name": "Victory and Learning",
-                        "description": "Character succeeds and learns important lesson",
-                        "emotional_tone": "triumphant, wise",
-                        "age_adaptations": {
-                            "5-6": "Simple success with clear lesson",
-                            "7-8": "Achievement through perseverance",
-                            "9-10": "Complex victory showing character growth"
-                        },
-                        "specific_requirements": {
-                            "victory_elements": [
-                                "Show the exact moment of success",
-                                "Describe how the challenge is overcome",
-                                "Include the emotional impact"
-                            ],
-                            "learning_elements": [
-                                "Specific lesson learned",
-                                "How the character changed",
-                                "What they can do now that they couldn't before"
-                            ]
-                        }
-                    },
-                    {
-                        "name": "Return Home",
-                        "description": "Character returns changed and shares wisdom",
-                        "emotional_tone": "satisfied, peaceful",
-                        "age_adaptations": {
-                            "5-6": "Happy return with simple sharing",
-                            "7-8": "Sharing adventure with family/friends",
-                            "9-10": "Reflection on growth and change"
-                        }
-                    }
-                ],
-                "description": "A transformative journey where the hero overcomes challenges and returns changed",
-                "themes": ["courage", "growth", "adventure", "friendship", "perseverance"]
-            },
-            "friendship": {
-                "name": "Friendship Story",
-                "stages": [
-                    {
-                        "name": "Loneliness or New Situation",
-                        "description": "Character needs a friend or meets someone new",
-                        "emotional_tone": "hopeful, open",
-                        "age_adaptations": {
-                            "5-6": "Want to play with someone new",
-                            "7-8": "Starting school or moving to new place",
-                            "9-10": "Complex social situation requiring friendship"
-                        }
-                    },
-                    {
-                        "name": "First Connection",
-                        "description": "Characters begin to interact",
-                        "emotional_tone": "tentative, curious",
-                        "age_adaptations": {
-                            "5-6": "Simple sharing or playing together",
-                            "7-8": "Discovering common interests",
-                            "9-10": "Meaningful conversation or shared experience"
-                        }
-                    },
-                    {
-                        "name": "Friendship Challenge",
-                        "description": "Specific misunderstanding or conflict arises between friends",
-                        "emotional_tone": "sad but hopeful",
-                        "age_adaptations": {
-                            "5-6": "Simple disagreement about what to play",
-                            "7-8": "Misunderstanding about intentions",
-                            "9-10": "Complex conflict requiring empathy"
-                        },
-                        "specific_requirements": {
-                            "conflict_types": [
-                                "Misunderstanding about actions or words",
-                                "Disagreement about how to solve a problem",
-                                "Feeling left out or excluded",
-                                "Different opinions about what to do"
-                            ],
-                            "emotional_impact": [
-                                "Show how each character feels",
-                                "Describe their reactions",
-                                "Include their thoughts about the situation"
-                            ],
-                            "conflict_development": [
-                                "How the problem starts",
-                                "What makes it worse",
-                                "How it affects their friendship"
-                            ]
-                        }
-                    },
-                    {
-                        "name": "Understanding and Forgiveness",
-                        "description": "Characters work through their differences",
-                        "emotional_tone": "understanding, caring",
-                        "age_adaptations": {
-                            "5-6": "Simple apology and making up",
-                            "7-8": "Talking through the problem together",
-                            "9-10": "Deep understanding and compromise"
-                        },
-                        "specific_requirements": {
-                            "resolution_steps": [
-                                "Realizing the misunderstanding",
-                                "Expressing feelings clearly",
-                                "Listening to each other",
-                                "Finding a solution together"
-                            ],
-                            "emotional_growth": [
-                                "Learning to see another's perspective",
-                                "Understanding the importance of communication",
-                                "Developing empathy and understanding"
-                            ],
-                            "reconciliation": [
-                                "Specific words of apology",
-                                "Actions that show forgiveness",
-                                "Plans to prevent future misunderstandings"
-                            ]
-                        }
-                    },
-                    {
-                        "name": "Stronger Friendship",
-                        "description": "Friendship is stronger after working through challenges",
-                        "emotional_tone": "warm, secure",
-                        "age_adaptations": {
-                            "5-6": "Playing happily together again",
-                            "7-8": "Celebrating their friendship",
-                            "9-10": "Deeper bond and mutual support"
-                        }
-                    }
-                ],
-                "description": "A story about the power of friendship and overcoming obstacles together",
-                "themes": ["friendship", "empathy", "communication", "forgiveness", "social skills"]
-            },
-            "three_act": {
-                "name": "Classic Three-Act Story",
-                "stages": [
-                    {
-                        "name": "Setup",
-                        "description": "Introduce characters, setting, and the central conflict",
-                        "emotional_tone": "intriguing, engaging",
-                        "age_adaptations": {
-                            "5-6": "Simple character and one clear problem",
-                            "7-8": "Character relationships and building tension",
-                            "9-10": "Complex setup with multiple story elements"
-                        }
-                    },
-                    {
-                        "name": "Rising Action",
-                        "description": "Conflict develops and complications arise",
-                        "emotional_tone": "escalating, engaging",
-                        "age_adaptations": {
-                            "5-6": "Problem gets a bit bigger but not scary",
-                            "7-8": "Multiple attempts to solve the problem",
-                            "9-10": "Layered complications and character development"
-                        }
-                    },
-                    {
-                        "name": "Climax",
-                        "description": "The main conflict reaches its peak",
-                        "emotional_tone": "intense but appropriate",
-                        "age_adaptations": {
-                            "5-6": "Clear moment where problem is solved",
-                            "7-8": "Exciting resolution requiring character's best effort",
-                            "9-10": "Pivotal moment showing character's growth"
-                        }
-                    },
-                    {
-                        "name": "Resolution",
-                        "description": "Conflicts are resolved and loose ends tied up",
-                        "emotional_tone": "resolved, peaceful",
-                        "age_adaptations": {
-                            "5-6": "Everything works out happily",
-                            "7-8": "Consequences addressed, lessons learned",
-                            "9-10": "Character reflection and future implications"
-                        }
-                    }
-                ],
-                "description": "Setup, confrontation, and resolution in three clear parts",
-                "themes": ["conflict resolution", "character development", "cause and effect"]
-            },
-            "problem_solution": {
-                "name": "Problem and Solution",
-                "stages": [
-                    {
-                        "name": "Happy Beginning",
-                        "description": "Character is content in their world",
-                        "emotional_tone": "cheerful, content",
-                        "age_adaptations": {
-                            "5-6": "Simple, happy activity",
-                            "7-8": "Character enjoying time with others",
-                            "9-10": "Character's normal life with small details"
-                        }
-                    },
-                    {
-                        "name": "Problem Appears",
-                        "description": "A manageable problem disrupts the happiness",
-                        "emotional_tone": "concerned but not scared",
-                        "age_adaptations": {
-                            "5-6": "Very simple problem (toy broken, friend sad)",
-                            "7-8": "Problem affecting multiple characters",
-                            "9-10": "Problem requiring thought and planning"
-                        }
-                    },
-                    {
-                        "name": "First Attempts",
-                        "description": "Character tries to solve the problem",
-                        "emotional_tone": "determined, trying",
-                        "age_adaptations": {
-                            "5-6": "One simple attempt that almost works",
-                            "7-8": "Two different approaches tried",
-                            "9-10": "Multiple creative solutions attempted"
-                        }
-                    },
-                    {
-                        "name": "Breakthrough",
-                        "description": "Character finds the right solution",
-                        "emotional_tone": "excited, proud",
-                        "age_adaptations": {
-                            "5-6": "Simple solution that works perfectly",
-                            "7-8": "Solution that helps everyone involved",
-                            "9-10": "Creative solution showing character growth"
-                        }
-                    },
-                    {
-                        "name": "Happy Ending",
-                        "description": "Problem solved, everyone happy, lesson learned",
-                        "emotional_tone": "joyful, peaceful",
-                        "age_adaptations": {
-                            "5-6": "Simple celebration of success",
-                            "7-8": "Sharing success with others",
-                            "9-10": "Reflection on what was learned"
-                        }
-                    }
-                ],
-                "description": "Simple structure: problem appears, attempts are made, solution found",
-                "themes": ["problem-solving", "persistence", "helping others", "creativity"]
-            },
-            "learning": {
-                "name": "Learning and Growth",
-                "stages": [
-                    {
-                        "name": "Curiosity or Need",
-                        "description": "Character encounters something they want or need to learn",
-                        "emotional_tone": "curious, interested",
-                        "age_adaptations": {
-                            "5-6": "Want to do something others can do",
-                            "7-8": "Need skill for specific goal or activity",
-                            "9-10": "Complex problem requiring new knowledge"
-                        }
-                    },
-                    {
-                        "name": "First Attempts",
-                        "description": "Character tries but struggles with new skill",
-                        "emotional_tone": "trying, frustrated but not giving up",
-                        "age_adaptations": {
-                            "5-6": "One attempt that doesn't work perfectly",
-                            "7-8": "Multiple attempts with gradual improvement",
-                            "9-10": "Complex learning process with setbacks"
-                        }
-                    },
-                    {
-                        "name": "Getting Help",
-                        "description": "Character seeks or receives guidance",
-                        "emotional_tone": "humble, receptive",
-                        "age_adaptations": {
-                            "5-6": "Simple help from parent or friend",
-                            "7-8": "Learning from teacher or mentor",
-                            "9-10": "Multiple sources of help and advice"
-                        }
-                    },
-                    {
-                        "name": "Practice and Progress",
-                        "description": "Character practices and slowly improves",
-                        "emotional_tone": "determined, gradually more confident",
-                        "age_adaptations": {
-                            "5-6": "Simple practice with visible improvement",
-                            "7-8": "Structured practice with milestones",
-                            "9-10": "Self-directed practice and goal-setting"
-                        }
-                    },
-                    {
-                        "name": "Success and Sharing",
-                        "description": "Character masters the skill and teaches or helps others",
-                        "emotional_tone": "proud, generous",
-                        "age_adaptations": {
-                            "5-6": "Simple success and showing others",
-                            "7-8": "Helping friend learn the same skill",
-                            "9-10": "Using new skill to solve problems for others"
-                        }
-                    }
-                ],
-                "description": "Character learns new skill or concept through experience",
-                "themes": ["learning", "persistence", "growth mindset", "asking for help", "sharing knowledge"]
-            },
-            "bedtime_gentle": {
-                "name": "Gentle Bedtime Journey",
-                "stages": [
-                    {
-                        "name": "Peaceful Setting",
-                        "description": "Establish a calm, beautiful, safe environment",
-                        "emotional_tone": "peaceful, serene",
-                        "age_adaptations": {
-                            "5-6": "Simple, cozy place like bedroom or garden",
-                            "7-8": "Magical but gentle setting like starlit meadow",
-                            "9-10": "Rich, peaceful world with calming details"
-                        }
-                    },
-                    {
-                        "name": "Gentle Activity",
-                        "description": "Character engages in calm, pleasant activity",
-                        "emotional_tone": "content, relaxed",
-                        "age_adaptations": {
-                            "5-6": "Simple activity like watching clouds",
-                            "7-8": "Gentle exploration or quiet conversation",
-                            "9-10": "Thoughtful activity like stargazing"
-                        }
-                    },
-                    {
-                        "name": "Quiet Wisdom",
-                        "description": "Character learns gentle lesson or gains peaceful insight",
-                        "emotional_tone": "wise, calm",
-                        "age_adaptations": {
-                            "5-6": "Simple realization about kindness or beauty",
-                            "7-8": "Gentle lesson about nature or friendship",
-                            "9-10": "Deeper insight about life or relationships"
-                        }
-                    },
-                    {
-                        "name": "Sleepy Conclusion",
-                        "description": "Story winds down with character feeling peaceful and sleepy",
-                        "emotional_tone": "drowsy, secure",
-                        "age_adaptations": {
-                            "5-6": "Character getting sleepy and cozy",
-                            "7-8": "Peaceful ending with character resting",
-                            "9-10": "Contemplative, drowsy conclusion"
-                        }
-                    }
-                ],
-                "description": "Calm, soothing story arc designed to help children wind down",
-                "themes": ["peace", "comfort", "nature", "reflection", "security"]
-            }
-        }
-        self.image_cache = {}  
+        self.transport = transport if transport is not None else OpenAITransport()
+        # One immutable client per backend, each with its own key, sharing the connection pool
+        self.chat_client = chat_client if chat_client is not None else ChatClient(self.transport, OPENAI_API_KEY)
+        self.image_client = (image_client if image_client is not None
+                             else ImageClient(self.transport, IMAGE_GEN_API_KEY))
+        self.story_arcs = STORY_ARCS
+        self.image_workers = max(1, image_workers)
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        self.story_index = story_index if story_index is not None else StoryIndex()
+        self.image_store = image_store if image_store is not None else ImageStore(suffix=IMAGE_SUFFIXES[IMAGE_FORMAT])
+        self._artifact_store = artifact_store
+        self._pdf_pool = pdf_pool
+        self.pdf_backend = pdf_backend
+        self._judge_pool = ThreadPoolExecutor(max_workers=JUDGE_WORKERS, thread_name_prefix="judge")
+        self._judgements = OrderedDict()
+        self._judgements_lock = threading.Lock()
+        self.arc_classifier = ARC_CLASSIFIER
+        
+    def call_model(self, prompt: str, max_tokens=DEFAULT_MAX_TOKENS, temperature=0.7, stream=False, use_cache=None,
+                   stage: str = "other"):
+        """Call the OpenAI API with the given prompt.
+
+        With stream=True a generator of content deltas is returned instead of the full reply.
+        Replies are served from the response cache unless use_cache is False; by default
+        only calls at or below CACHE_MAX_TEMPERATURE use it. Token usage and errors are
+        recorded in the metrics under stage.
+        """
+        if stream:
+            return self._stream_model(prompt, max_tokens, temperature, stage)
         
-    def call_model(self, prompt: str, max_tokens=3000, temperature=0.7) -> str:
-        """Call the OpenAI API with the given prompt."""
+        with tracing.span("call_model", stage=stage, model=CHAT_MODEL, temperature=temperature,
+                          max_tokens=max_tokens) as span:
+            if use_cache is None:
+                use_cache = temperature <= CACHE_MAX_TEMPERATURE
+            if use_cache:
+                cache_key = ResponseCache.make_key(CHAT_MODEL, prompt, temperature, max_tokens)
+                cached = self.response_cache.get(cache_key)
+                CACHE_LOOKUPS.inc(cache="response", result="miss" if cached is None else "hit")
+                span.set(cached=cached is not None)
+                if cached is not None:
+                    return cached
+            
+            try:
+                resp = self.chat_client.complete({
+                    "model": CHAT_MODEL,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                })
+                usage = resp.get("usage", {})
+                MODEL_TOKENS.inc(usage.get("prompt_tokens", 0), stage=stage, kind="prompt")
+                MODEL_TOKENS.inc(usage.get("completion_tokens", 0), stage=stage, kind="completion")
+                span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+                content = resp["choices"][0]["message"]["content"]
+                if use_cache and content:
+                    self.response_cache.set(cache_key, content)
+                return content
+            except Exception as e:
+                STAGE_ERRORS.inc(stage=stage)
+                span.error = str(e)
+                logger.error(f"Error calling OpenAI API: {str(e)}")
+                return ""
+
+    def _stream_model(self, prompt: str, max_tokens: int, temperature: float, stage: str):
+        """Yield content deltas from a streamed ChatCompletion as they arrive."""
+        span = tracing.start_span("call_model", stage=stage, model=CHAT_MODEL, temperature=temperature,
+                                  max_tokens=max_tokens, stream=True)
+        chunks = 0
         try:
-            resp = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                stream=False,
-                max_tokens=max_tokens,
-                temperature=temperature,
-            )
-            return resp.choices[0].message["content"]
+            for delta in self.chat_client.stream({
+                "model": CHAT_MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+            }):
+                chunks += 1
+                yield delta
         except Exception as e:
-            console.print(f"[red]Error calling OpenAI API: {str(e)}[/red]")
-            return ""
+            STAGE_ERRORS.inc(stage=stage)
+            span.error = str(e)
+            logger.error(f"Error streaming from OpenAI API: {str(e)}")
+        finally:
+            span.set(chunks=chunks)
+            tracing.end_span(span)
 
     def select_story_arc(self, user_input: str) -> str:
-        """Select the most appropriate story arc based on the user input."""
+        """Select the most appropriate story arc based on the user input.
+
+        The local keyword classifier decides on its own when it is confident enough;
+        otherwise the model is asked, with the classifier's pick as the fallback.
+        """
+        with stage_timer("select_arc"), tracing.span("select_story_arc") as span:
+            best_guess, confidence = self.arc_classifier.classify(user_input)
+            span.set(arc=best_guess, confidence=confidence, method="classifier")
+            if confidence >= ARC_CONFIDENCE_THRESHOLD:
+                return best_guess
+            arc = self._ask_story_arc(user_input) or best_guess
+            span.set(arc=arc, method="model")
+            return arc
+
+    def _ask_story_arc(self, user_input: str):
+        """Ask the model for the arc, returning None if its reply names none."""
+
         prompt = f"""Based on this story request: "{user_input}", which story arc would be most appropriate? Choose from:
 1. Hero's Journey - for adventure and transformation stories
 2. Friendship - for stories about relationships and teamwork
@@ -453,196 +210,25 @@ class StoryGenerator:
 
 Respond with just the name of the arc (hero's_journey, friendship, three_act, problem_solution, learning, bedtime_gentle)."""
         
-        arc_choice = self.call_model(prompt, temperature=0.3).strip().lower()
-        return arc_choice if arc_choice in self.story_arcs else "hero's_journey" 
+        reply = self.call_model(prompt, temperature=0.3, stage="select_arc").strip().lower()
+        return self._match_arc(reply)
+
+    def _match_arc(self, reply: str):
+        """Find the arc named in a model reply, tolerating extra words and punctuation."""
+        normalized = reply.replace("-", "_").replace(" ", "_").strip("._\"'")
+        if normalized in self.story_arcs:
+            return normalized
+        for arc_key, arc_info in self.story_arcs.items():
+            if arc_key in normalized or arc_info["name"].lower() in reply:
+                return arc_key
+        return None
         
-    def generate_story_prompt(self, user_input: str) -> str:
+    def generate_story_prompt(self, user_input: str, selected_arc: str = None,
+                              age_category: str = DEFAULT_AGE_CATEGORY) -> str:
         """Generate a prompt for story creation."""
-        selected_arc = self.select_story_arc(user_input)
-        arc_info = self.story_arcs[selected_arc]
-        
-        age_category = "7-8"  
-        
-        story_structure = "\n".join([
-            f"\n{stage['name']}:\n"
-            f"Purpose: {stage['description']}\n"
-            f"Emotional Tone: {stage['emotional_tone']}\n"
-            f"Age-Appropriate Approach: {stage['age_adaptations'][age_category]}"
-            for stage in arc_info['stages']
-        ])
-        
-        return f"""Create a rich, detailed, and engaging bedtime story (for ages 5-10) based on the following request: "{user_input}"
-
-IMPORTANT: The story MUST be between 1500-2000 words in length. This is a strict requirement.
-
-Story Arc: {arc_info['name']}
-Description: {arc_info['description']}
-Themes: {', '.join(arc_info['themes'])}
-
-Story Structure:
-{story_structure}
-
-Detailed Requirements:
-1. Character Development and Growth:
-   - Give EVERY character a unique name and personality
-   - Include detailed physical descriptions and unique traits
-   - Show character growth THROUGHOUT the story, not just at the end
-   - For the main character, show:
-     * What they believe or know at the start
-     * How their understanding changes with each challenge
-     * Small lessons learned from each encounter
-     * How their perspective shifts throughout the story
-     * What mistakes they make and what they learn from them
-   - For each new character introduced:
-     * Describe exactly how and where they meet
-     * Show their first interaction in detail
-     * Include their initial reaction to each other
-     * Describe their unique way of speaking and moving
-     * Show how their relationship develops
-   - Add meaningful dialogue that reveals character growth
-   - When introducing new characters, give them names and describe their appearance
-
-2. Setting and Atmosphere:
-   - Create vivid, sensory-rich descriptions of locations
-   - Use all five senses in descriptions (sight, sound, smell, touch, taste)
-   - Include weather, time of day, and environmental details
-   - Make the setting feel alive and interactive
-   - Describe how the setting changes as the story progresses
-
-3. Plot and Structure:
-   - Follow the story arc structure while adding rich details
-   - NEVER use vague descriptions like "faced challenges" or "overcame obstacles"
-   - For each challenge, describe:
-     * Exactly what the challenge was
-     * How it looked, sounded, and felt
-     * Why it was difficult
-     * How the characters solved it
-     * What they learned from it
-   - For example, instead of "they solved riddles", write:
-     * The specific riddle they had to solve
-     * How they figured it out
-     * What made it tricky
-     * What they learned about themselves or others
-     * Show the exact moment of realization
-     * Include the actual riddle and solution
-     * Show the characters' thought process
-     * Include their discussion about the riddle
-   - For bridges or obstacles, describe:
-     * What made them dangerous (rotting wood, missing planks, etc.)
-     * How the characters overcame them
-     * What they felt while doing it
-     * What they learned about courage or perseverance
-     * Show the specific steps they took to cross
-     * Include any tools or help they used
-     * Describe the physical sensations (sweaty palms, racing heart, etc.)
-     * Show how they supported each other
-   - For each challenge, show:
-     * The initial attempt
-     * What went wrong (if anything)
-     * How they adjusted their approach
-     * The final solution
-     * What they learned from the process
-     * The emotional impact on each character
-   - For each new character introduced:
-     * Show their first meeting in detail
-     * Include their initial conversation
-     * Describe how they decide to work together
-     * Show their unique contributions to the team
-   - Create clear cause-and-effect relationships
-   - Build tension and resolution naturally
-   - Show the thought process behind each solution
-   - Include specific dialogue during challenges
-   - Show how each character contributes to solving problems
-
-4. Language and Style:
-   - Use age-appropriate but engaging vocabulary
-   - Include descriptive adjectives and adverbs
-   - Vary sentence structure for rhythm
-   - Add gentle humor where appropriate
-   - Use metaphors and similes suitable for children
-   - Create vivid imagery that brings scenes to life
-
-5. Emotional Engagement:
-   - Create emotional moments that resonate
-   - Show characters' feelings through actions and dialogue
-   - Include moments of wonder and discovery
-   - Balance excitement with calm moments
-   - Show how emotions change as characters learn and grow
-   - Include moments of tension and release
-
-6. Educational Elements and Life Lessons:
-   - Include a clear, meaningful moral or life lesson that children can understand and apply
-   - The lesson should be naturally woven into the story, not just stated at the end
-   - Show the consequences of both good and bad choices
-   - Demonstrate positive values like:
-     * Perseverance and never giving up
-     * Kindness and empathy
-     * Courage in the face of fear
-     * Friendship and teamwork
-     * Honesty and trust
-     * Responsibility and consequences
-     * Self-confidence and believing in oneself
-   - Make the lesson relatable to children's everyday lives
-   - Show how the characters grow and learn from their experiences
-   - Include multiple small lessons throughout the story
-   - Show exactly how each lesson is learned through specific events
-
-7. Story Length and Pacing:
-   - The story MUST be between 1500-2000 words in length
-   - This is a strict requirement - do not make the story shorter
-   - Balance action scenes with quieter moments
-   - Include enough detail to paint vivid pictures
-   - Maintain steady pacing throughout
-   - Allow time for reflection and learning
-   - Give each scene enough space to develop fully
-   - Ensure each character interaction and challenge is fully developed
-   - Include enough detail to make the story immersive and engaging
-   - Each major scene should be at least 200-300 words
-   - Each character introduction should be at least 150-200 words
-   - Each challenge and its resolution should be at least 250-300 words
-
-8. Dialogue Requirements:
-   - Make dialogue natural and character-specific
-   - Include emotional expressions
-   - Use dialogue to advance the plot
-   - Show relationships through conversation
-   - Give each character a unique way of speaking
-   - Use dialogue to show learning and growth
-   - Include meaningful conversations that reveal character
-
-9. Sensory Details:
-   - Describe how things look, sound, feel, smell, and taste
-   - Include environmental sounds and textures
-   - Add weather and time-of-day details
-   - Make the world feel tangible and real
-   - Use sensory details to create atmosphere
-
-10. Ending Requirements:
-    - Provide a satisfying conclusion that reinforces the story's moral
-    - Show how the characters have grown and learned
-    - Include a clear but gentle reminder of the lesson learned
-    - Leave room for imagination while ensuring the message is clear
-    - End with a positive, hopeful note that encourages children to apply the lesson
-    - Show how the main character's understanding has changed from the beginning
-    - Tie up all major story threads
-
-11. Specific Encounters:
-    - For each challenge, include:
-      * The exact nature of the challenge
-      * What made it difficult or dangerous
-      * How the characters felt about it
-      * The specific steps they took to overcome it
-      * What they learned from it
-      * How their understanding changed
-    - Make each encounter unique and memorable
-    - Show the consequences of their actions
-    - Connect each challenge to the story's main lesson
-    - Show how each challenge contributes to the character's growth
-    - Include specific details that make each encounter special
-
-Format the story with clear paragraphs, engaging dialogue, and rich descriptions. Make each scene come alive with specific details and sensory information. Remember to name every character and describe specific encounters rather than using general terms. NEVER use vague phrases like "faced challenges" or "overcame obstacles" - always describe exactly what happened. Most importantly, ensure the story shows the main character learning and growing throughout the journey, not just at the end. Make each scene detailed and specific, showing exactly how characters meet, interact, and learn from each other.
-
-IMPORTANT: The story MUST be between 1500-2000 words in length. This is a strict requirement."""
+        if selected_arc is None:
+            selected_arc = self.select_story_arc(user_input)
+        return story_prompt(selected_arc, age_category, user_input)
 
     def judge_story_prompt(self, story: str) -> str:
         """Generate a prompt for story evaluation."""
@@ -666,194 +252,489 @@ Story to evaluate:
 
 Provide the response in valid JSON format with these exact keys: age_appropriateness, story_structure, educational_value, entertainment_value, language_clarity, length_appropriateness, emotional_tone, character_development, setting_atmosphere, dialogue_quality, sensory_details, overall_score, suggestions"""
 
-    def generate_story(self, user_input: str) -> tuple[str, dict]:
-        """Generate a story and get judge feedback."""
-        # Generate initial story
-        story_prompt = self.generate_story_prompt(user_input)
-        story = self.call_model(story_prompt)
-        
-        # Get judge feedback
+    @tracing.traced()
+    def judge_story(self, story: str) -> dict:
+        """Get judge feedback for a finished story."""
         judge_prompt = self.judge_story_prompt(story)
-        judge_feedback = self.call_model(judge_prompt, temperature=0.3)
+        with stage_timer("judge"):
+            judge_feedback = self.call_model(judge_prompt, temperature=0.3, stage="judge")
         
         try:
             feedback = json.loads(judge_feedback)
         except json.JSONDecodeError:
+            STAGE_ERRORS.inc(stage="judge")
             feedback = {
                 "error": "Could not parse judge feedback",
                 "raw_feedback": judge_feedback
             }
         
+        tracing.set_attributes(overall_score=feedback.get("overall_score"), parsed="error" not in feedback)
+        return feedback
+
+    @staticmethod
+    def feedback_score(feedback: dict) -> float:
+        """The judge's overall score as a number, or -1 if it is missing or unparseable."""
+        try:
+            return float(feedback.get("overall_score"))
+        except (TypeError, ValueError):
+            return -1.0
+
+    def candidate_cost(self, prompt: str) -> int:
+        """Worst-case tokens for writing one candidate from prompt and judging it."""
+        write = estimate_tokens({"messages": [{"content": prompt}], "max_tokens": DEFAULT_MAX_TOKENS})
+        # The judge reads the whole story back, so count the story as judge input as well
+        judge = estimate_tokens({"messages": [{"content": self.judge_story_prompt("")}],
+                                 "max_tokens": DEFAULT_MAX_TOKENS})
+        return write + judge + DEFAULT_MAX_TOKENS
+
+    @tracing.traced()
+    def generate_best_story(self, user_input: str, n: int = BEST_OF_N, token_budget: int = BEST_OF_TOKEN_BUDGET,
+                            target_score: float = BEST_OF_TARGET_SCORE) -> tuple[str, dict]:
+        """Write up to n candidate stories in parallel, judge each, and return the best one.
+
+        Only as many candidates as fit in token_budget are started (always at least one).
+        Each is judged as soon as it is written, and the first to reach target_score is
+        returned without waiting for the rest.
+        """
+        selected_arc = self.select_story_arc(user_input)
+        prompt = self.generate_story_prompt(user_input, selected_arc)
+        count = max(1, min(n, token_budget // self.candidate_cost(prompt)))
+        
+        def write_and_judge():
+            # Sampled at the normal temperature and never cached, so candidates differ
+            with stage_timer("write_story"):
+                story = self.call_model(prompt, max_tokens=DEFAULT_MAX_TOKENS, use_cache=False, stage="write_story")
+            return story, (self.judge_story(story) if story else {"error": "No story was generated"})
+        
+        best = None
+        pool = ThreadPoolExecutor(max_workers=count, thread_name_prefix="candidate")
+        try:
+            for future in as_completed([pool.submit(tracing.bind(write_and_judge)) for _ in range(count)]):
+                story, feedback = future.result()
+                if best is None or self.feedback_score(feedback) > self.feedback_score(best[1]):
+                    best = (story, feedback)
+                if self.feedback_score(feedback) >= target_score:
+                    break
+        finally:
+            # Don't wait for candidates still in flight once we have a winner
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        tracing.set_attributes(arc=selected_arc, candidates=count, best_score=self.feedback_score(best[1]))
+        logger.info(f"Best of {count} candidates scored {self.feedback_score(best[1])}")
+        return best
+
+    def start_judging(self, story: str) -> str:
+        """Judge a story in the background and return a story ID to collect the feedback with."""
+        story_id = uuid.uuid4().hex
+        future = self._judge_pool.submit(tracing.bind(self.judge_story), story)
+        with self._judgements_lock:
+            self._judgements[story_id] = future
+            while len(self._judgements) > JUDGE_RESULTS_MAX:
+                self._judgements.popitem(last=False)
+        return story_id
+
+    def judge_status(self, story_id: str):
+        """'pending' or 'done' for a story ID from start_judging, or None if it is unknown."""
+        with self._judgements_lock:
+            future = self._judgements.get(story_id)
+        if future is None:
+            return None
+        return "done" if future.done() else "pending"
+
+    def get_feedback(self, story_id: str, timeout: float = None):
+        """Return the judge feedback for a story ID, waiting up to timeout seconds.
+
+        Returns None if the ID is unknown or the judge hasn't finished in time.
+        """
+        with self._judgements_lock:
+            future = self._judgements.get(story_id)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+
+    def _when_judged(self, story_id: str, callback):
+        """Call callback with a story's feedback once its background judge finishes."""
+        with self._judgements_lock:
+            future = self._judgements.get(story_id)
+        if future is not None:
+            future.add_done_callback(lambda done: callback(done.result()))
+
+    @tracing.traced()
+    def write_story(self, user_input: str, on_stage=None, mode: str = None) -> str:
+        """Pick an arc and write the story, without judging it.
+
+        on_stage, if given, is called with the name of each pipeline stage as it starts.
+        mode overrides STORY_MODE for this story.
+        """
+        report_stage = on_stage or (lambda stage: None)
+        
+        # Pick the story arc
+        report_stage("selecting_arc")
+        selected_arc = self.select_story_arc(user_input)
+        
+        # Generate initial story
+        report_stage("writing_story")
+        tracing.set_attributes(arc=selected_arc, mode=mode or STORY_MODE)
+        with stage_timer("write_story"):
+            if (mode or STORY_MODE) == "outline":
+                return self.write_outlined_story(user_input, selected_arc)
+            story_prompt = self.generate_story_prompt(user_input, selected_arc)
+            return self.call_model(story_prompt, stage="write_story")
+
+    def write_outlined_story(self, user_input: str, selected_arc: str,
+                             age_category: str = DEFAULT_AGE_CATEGORY) -> str:
+        """Write a story as an outline plus one section per arc stage, written in parallel.
+
+        The outline (setting, character bible and a summary per stage) is the shared
+        context every section is written from; a short continuity pass then adds
+        transitions between the sections. Latency is roughly outline + longest section.
+        """
+        with stage_timer("outline"):
+            outline = self.call_model(outline_prompt(selected_arc, age_category, user_input), stage="outline")
+        if not outline:
+            return ""
+        try:
+            summaries = [section.get("summary", "") for section in json.loads(outline).get("sections", [])]
+        except (json.JSONDecodeError, AttributeError):
+            # The raw plan is still useful context even if it isn't valid JSON
+            summaries = []
+        
+        stage_count = len(self.story_arcs[selected_arc]["stages"])
+        prompts = [
+            section_prompt(selected_arc, age_category, user_input, outline, i,
+                           summaries[i] if i < len(summaries) else "")
+            for i in range(stage_count)
+        ]
+        def write_section(prompt):
+            with stage_timer("section"):
+                return self.call_model(prompt, stage="section").strip()
+        
+        with ThreadPoolExecutor(max_workers=stage_count, thread_name_prefix="section") as pool:
+            sections = list(pool.map(tracing.bind(write_section), prompts))
+        sections = [section for section in sections if section]
+        
+        transitions = []
+        if len(sections) > 1:
+            with stage_timer("continuity"):
+                reply = self.call_model(continuity_prompt(sections), max_tokens=CONTINUITY_MAX_TOKENS,
+                                        use_cache=False, stage="continuity")
+            try:
+                transitions = [str(t).strip() for t in json.loads(reply)]
+            except (json.JSONDecodeError, TypeError):
+                logger.warning("Could not parse continuity pass, joining sections as written")
+        
+        parts = []
+        for i, section in enumerate(sections):
+            if i > 0 and i - 1 < len(transitions) and transitions[i - 1]:
+                parts.append(transitions[i - 1])
+            parts.append(section)
+        return "\n\n".join(parts)
+
+    @tracing.traced()
+    def generate_story(self, user_input: str, on_stage=None, reuse: bool = True) -> tuple[str, dict]:
+        """Generate a story and get judge feedback.
+
+        on_stage, if given, is called with the name of each pipeline stage as it starts.
+        With reuse, a story already written for a nearly identical prompt is returned
+        instead, skipping every model call.
+        """
+        if reuse:
+            reused = self.find_similar_story(user_input)
+            if reused is not None:
+                return reused
+        
+        story = self.write_story(user_input, on_stage)
+        
+        # Get judge feedback
+        if on_stage:
+            on_stage("judging")
+        feedback = self.judge_story(story)
+        
+        self.remember_story(user_input, story, feedback)
         return story, feedback
+    
+    def find_similar_story(self, user_input: str):
+        """Return (story, feedback) stored for a near-duplicate of user_input, or None."""
+        match = self.story_index.lookup(user_input)
+        CACHE_LOOKUPS.inc(cache="story_index", result="miss" if match is None else "hit")
+        if match is None:
+            return None
+        tracing.set_attributes(reused_story=True, reused_similarity=round(match["similarity"], 3))
+        return match["story"], match["feedback"]
+    
+    def remember_story(self, user_input: str, story: str, feedback: dict):
+        """Make a judged story available to later near-duplicate prompts."""
+        if story and feedback and "error" not in feedback:
+            self.story_index.add(user_input, story, feedback)
+
+    def add_pdf(self, result: dict, user_input: str) -> dict:
+        """Build the PDF for a result dict (story, feedback, optional story_id) and set its pdf_filename.
+
+        If the render pool fails, pdf_error is set instead: the story is still good and
+        can be rendered again on download.
+        """
+        try:
+            result["pdf_filename"] = self.generate_pdf(result["story"], result["feedback"], user_input,
+                                                       story_id=result.get("story_id"))
+        except PdfPoolError as e:
+            logger.error(f"Could not build the story's PDF: {str(e)}")
+            result["pdf_filename"] = None
+            result["pdf_error"] = str(e)
+        return result
+
+    @tracing.traced()
+    def run_story_request(self, user_input: str, mode: str = None, reuse: bool = True, async_judge: bool = False,
+                          with_pdf: bool = True, stream: bool = False, on_stage=None, on_event=None) -> dict:
+        """Answer a story request end to end and return a dict with story, story_id, feedback and pdf_filename.
+
+        With reuse, a story already written for a nearly identical prompt is served
+        (marked reused=True) instead. Otherwise the story is written (with stream_story
+        if stream is set), judged in the background while the PDF's illustrations are
+        fetched, and remembered for later near-duplicates once judged. With async_judge
+        the result is returned as soon as the story is written, without feedback or PDF.
+
+        on_stage is called with each pipeline stage as it starts. on_event, if given, is
+        called as each part is ready: ("token", text) for each piece of the story,
+        ("story", result) once it is written, ("feedback", feedback) and ("pdf", result).
+        A PDF the render pool couldn't build leaves pdf_filename None and sets pdf_error.
+        Raises StoryWriteError if the model returned no story.
+        """
+        report_stage = on_stage or (lambda stage: None)
+        emit = on_event or (lambda event, value: None)
+        
+        reused = self.find_similar_story(user_input) if reuse else None
+        if reused is not None:
+            story, feedback = reused
+            result = {"story": story, "story_id": None, "feedback": feedback, "pdf_filename": None, "reused": True}
+            emit("token", story)
+            emit("story", result)
+            emit("feedback", feedback)
+            if with_pdf:
+                report_stage("building_pdf")
+                self.add_pdf(result, user_input)
+                emit("pdf", result)
+            return result
+        
+        if stream:
+            report_stage("writing_story")
+            parts = []
+            for delta in self.stream_story(user_input):
+                parts.append(delta)
+                emit("token", delta)
+            story = "".join(parts)
+        else:
+            story = self.write_story(user_input, on_stage, mode)
+        if not story.strip():
+            raise StoryWriteError("The story could not be written, please try again")
+        
+        story_id = self.start_judging(story)
+        result = {"story": story, "story_id": story_id, "feedback": None, "pdf_filename": None}
+        emit("story", result)
+        if on_event:
+            self._when_judged(story_id, lambda feedback: on_event("feedback", feedback))
+        if async_judge:
+            # The feedback is collected later with get_feedback
+            self._when_judged(story_id, lambda feedback: self.remember_story(user_input, story, feedback))
+            return result
+        
+        # The PDF's illustrations are fetched while the judge is still running
+        report_stage("judging")
+        if with_pdf:
+            report_stage("building_pdf")
+            self.add_pdf(result, user_input)
+            emit("pdf", result)
+        result["feedback"] = self.get_feedback(story_id)
+        self.remember_story(user_input, story, result["feedback"])
+        return result
+
+    def stream_story(self, user_input: str):
+        """Yield the story text in pieces as the model writes it."""
+        story_prompt = self.generate_story_prompt(user_input)
+        yield from self.call_model(story_prompt, stream=True, stage="write_story")
 
     def generate_image(self, scene_description: str) -> str:
-        """Generate an image for a story scene using the image generation API."""
+        """Generate an image for a story scene and return the path of the stored file.
+
+        Returns None if generation failed or the image store is in-memory only.
+        """
+        if self.generate_image_bytes(scene_description) is None:
+            return None
+        return self.image_store.path_for(scene_description)
+
+    def generate_image_bytes(self, scene_description: str) -> bytes:
+        """Generate an image for a story scene, reusing the stored image for a scene seen before.
+
+        New images are downscaled and recompressed for the PDF once, before they are stored.
+        """
+        created = []
+        
+        def create():
+            created.append(True)
+            with stage_timer("generate_image"):
+                image_data = self._request_image(scene_description)
+                return optimize_image(image_data) if image_data else None
+        
+        with tracing.span("generate_image") as span:
+            image_data = self.image_store.get_or_create(scene_description, create)
+            span.set(cached=not created, bytes=len(image_data) if image_data else 0)
+        CACHE_LOOKUPS.inc(cache="image", result="miss" if created else "hit")
+        return image_data
+
+    def _request_image(self, scene_description: str) -> bytes:
+        """Ask the image generation API for a scene and return the PNG bytes."""
+        images = self._request_images(scene_description, 1)
+        return images[0] if images else None
+
+    def _request_images(self, scene_description: str, n: int) -> list:
+        """Ask the image generation API for n images of a scene in one request."""
+        tracing.set_attributes(requested_images=n)
         try:
-            # Temporarily set the API key for image generation
-            original_api_key = openai.api_key
-            openai.api_key = IMAGE_GEN_API_KEY
-            
-            # Create image using the openai module directly
-            response = openai.Image.create(
-                prompt=f"Children's book illustration style: {scene_description}",
-                n=1,
-                size="512x512",
-                response_format="b64_json"
-            )
-            
-            # Restore the original API key for story generation
-            openai.api_key = original_api_key
+            response = self.image_client.generate({
+                "prompt": f"Children's book illustration style: {scene_description}",
+                "n": n,
+                "size": "512x512",
+                "response_format": "b64_json"
+            })
             
             if response and 'data' in response:
                 # Get the base64 image data
-                image_data = response['data'][0]['b64_json']
-                
-                # Save the image
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                image_filename = f"story_image_{timestamp}.png"
-                
-                with open(image_filename, "wb") as f:
-                    f.write(base64.b64decode(image_data))
-                
-                return image_filename
+                return [base64.b64decode(image['b64_json']) for image in response['data']]
             else:
-                console.print("[red]No image data received from the API[/red]")
-                return None
+                STAGE_ERRORS.inc(stage="generate_image")
+                logger.error("No image data received from the API")
+                return []
                 
         except Exception as e:
-            # Make sure to restore the original API key even if there's an error
-            openai.api_key = original_api_key
-            console.print(f"[red]Error in image generation: {str(e)}[/red]")
-            return None
+            STAGE_ERRORS.inc(stage="generate_image")
+            logger.error(f"Error in image generation: {str(e)}")
+            return []
 
-    def generate_pdf(self, story: str, feedback: dict, user_input: str) -> str:
-        """Generate a PDF version of the story with illustrations and feedback."""
-        # Create a filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"bedtime_story_{timestamp}.pdf"
-        
-        # Create the PDF document
-        doc = SimpleDocTemplate(
-            filename,
-            pagesize=letter,
-            rightMargin=72,
-            leftMargin=72,
-            topMargin=72,
-            bottomMargin=72
-        )
-        
-        # Create custom styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30,
-            textColor=colors.HexColor('#2E4053')
-        )
-        subtitle_style = ParagraphStyle(
-            'CustomSubtitle',
-            parent=styles['Heading2'],
-            fontSize=16,
-            spaceAfter=20,
-            textColor=colors.HexColor('#566573')
-        )
-        body_style = ParagraphStyle(
-            'CustomBody',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=12,
-            leading=18
-        )
-        feedback_style = ParagraphStyle(
-            'CustomFeedback',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.HexColor('#7F8C8D'),
-            spaceAfter=12
-        )
-        
-        # Build the PDF content
-        story_content = []
-        
-        # Add title
-        story_content.append(Paragraph("A Magical Bedtime Story", title_style))
-        story_content.append(Spacer(1, 20))
-        
-        # Add subtitle with the story request
-        story_content.append(Paragraph(f"Based on: {user_input}", subtitle_style))
-        story_content.append(Spacer(1, 30))
-        
-        # Split story into scenes and generate images
-        paragraphs = story.split('\n\n')
-        for i, paragraph in enumerate(paragraphs):
-            if paragraph.strip():
-                # Add story paragraph
-                story_content.append(Paragraph(paragraph, body_style))
-                story_content.append(Spacer(1, 12))
-                
-                # Generate image for every third paragraph (to avoid too many images)
-                if i % 3 == 0:
-                    # Create a scene description for image generation
-                    scene_description = f"Children's book illustration of: {paragraph[:200]}"
-                    
-                    # Check if we already have this image in cache
-                    if scene_description not in self.image_cache:
-                        image_filename = self.generate_image(scene_description)
-                        if image_filename:
-                            self.image_cache[scene_description] = image_filename
-                    
-                    # Add image if we have it
-                    if scene_description in self.image_cache:
-                        try:
-                            img = Image(self.image_cache[scene_description], width=400, height=400)
-                            story_content.append(img)
-                            story_content.append(Spacer(1, 20))
-                        except Exception as e:
-                            console.print(f"[yellow]Warning: Could not add image to PDF: {str(e)}[/yellow]")
-        
-        # Add feedback section if available
-        if "error" not in feedback:
-            story_content.append(Spacer(1, 30))
-            story_content.append(Paragraph("Story Evaluation", subtitle_style))
-            
-            metrics = [
-                ("Age Appropriateness", feedback.get("age_appropriateness", "N/A")),
-                ("Story Structure", feedback.get("story_structure", "N/A")),
-                ("Educational Value", feedback.get("educational_value", "N/A")),
-                ("Entertainment Value", feedback.get("entertainment_value", "N/A")),
-                ("Language Clarity", feedback.get("language_clarity", "N/A")),
-                ("Length Appropriateness", feedback.get("length_appropriateness", "N/A")),
-                ("Emotional Tone", feedback.get("emotional_tone", "N/A")),
-                ("Character Development", feedback.get("character_development", "N/A")),
-                ("Setting and Atmosphere", feedback.get("setting_atmosphere", "N/A")),
-                ("Dialogue Quality", feedback.get("dialogue_quality", "N/A")),
-                ("Sensory Details", feedback.get("sensory_details", "N/A")),
-                ("Overall Score", feedback.get("overall_score", "N/A"))
-            ]
-            
-            for metric, score in metrics:
-                story_content.append(Paragraph(f"{metric}: {score}/10", feedback_style))
-            
-            if "suggestions" in feedback:
-                story_content.append(Spacer(1, 12))
-                story_content.append(Paragraph("Suggestions for Improvement:", feedback_style))
-                story_content.append(Paragraph(feedback["suggestions"], feedback_style))
+    @tracing.traced()
+    def generate_images(self, scene_descriptions) -> dict:
+        """Generate images for several scenes concurrently, returning a scene -> image bytes map.
+
+        Scenes already in the image store are served from it. New scenes that are close
+        enough to share a prompt are requested together with n>1; the rest one at a time.
+        """
+        scenes = list(dict.fromkeys(scene_descriptions))
+        images = {}
+        for scene in scenes:
+            image_data = self.image_store.get(scene)
+            if image_data:
+                # Misses are counted once they are generated, by batch or by generate_image_bytes
+                CACHE_LOOKUPS.inc(cache="image", result="hit")
+                images[scene] = image_data
+        
+        batches = group_scenes([scene for scene in scenes if scene not in images], prefix=ILLUSTRATION_PREFIX)
+        tracing.set_attributes(scenes=len(scenes), cached=len(images), batches=len(batches))
+        if not batches:
+            return images
+        
+        with ThreadPoolExecutor(max_workers=min(self.image_workers, len(batches))) as pool:
+            for batch_images in pool.map(tracing.bind(self._generate_batch), batches):
+                images.update(batch_images)
+        tracing.set_attributes(images=len(images))
+        return images
+
+    def _generate_batch(self, scenes: list) -> dict:
+        """Generate one batch from group_scenes, fanning the results back out to its scenes.
+
+        Every image in the batch is drawn from the first scene's prompt, so only that one is
+        stored; the others are used for this request and never cached under their own scene.
+        """
+        results = {}
+        if len(scenes) > 1:
+            with stage_timer("generate_image"), tracing.span("generate_image", batch=len(scenes)):
+                for scene, image_data in zip(scenes, self._request_images(scenes[0], len(scenes))):
+                    image_data = optimize_image(image_data)
+                    if scene == scenes[0]:
+                        self.image_store.put(scene, image_data)
+                    results[scene] = image_data
+            # Only the scenes the batch filled; the rest are counted by generate_image_bytes below
+            if results:
+                CACHE_LOOKUPS.inc(len(results), cache="image", result="miss")
+        
+        # Single scenes, and anything a failed batch request didn't cover
+        for scene in scenes:
+            if scene not in results:
+                image_data = self.generate_image_bytes(scene)
+                if image_data:
+                    results[scene] = image_data
+        return results
+
+    @tracing.traced()
+    def generate_pdf(self, story: str, feedback: dict, user_input: str, in_memory: bool = False,
+                     story_id: str = None, wait_for_judge: bool = True):
+        """Generate a PDF version of the story with illustrations and feedback.
+
+        Saves the PDF in the artifact store and returns its '<id>.pdf' download name, or with
+        in_memory=True returns the rendered BytesIO buffer (positioned at the start) instead.
+        
+        If feedback is None and a story_id from start_judging is given, the background judge
+        result is used; it is collected after the illustrations, so the two overlap. With
+        wait_for_judge=False the evaluation section is left out if the judge isn't done yet.
+        """
+        # Generate all the illustrations up front, in parallel
+        scenes = illustration_plan(story)
+        with stage_timer("illustrations"):
+            images = self.generate_images(scenes.values())
+        
+        if feedback is None and story_id is not None:
+            feedback = self.get_feedback(story_id, timeout=None if wait_for_judge else 0)
         
         # Build the PDF
-        doc.build(story_content)
+        illustrations = {i: images[scene] for i, scene in scenes.items() if scene in images}
+        pool = self.pdf_pool
+        with stage_timer("build_pdf"), tracing.span("build_pdf", backend="process" if pool else "inline"):
+            if pool is None:
+                data = render_pdf(story, feedback, user_input, illustrations)
+            else:
+                # Stored images are passed to the worker by path rather than copied over
+                for i, scene in scenes.items():
+                    path = self.image_store.path_for(scene)
+                    if i in illustrations and path and os.path.exists(path):
+                        illustrations[i] = path
+                data = pool.render({
+                    "story": story,
+                    "feedback": feedback,
+                    "user_input": user_input,
+                    "images": illustrations
+                })
+        tracing.set_attributes(paragraphs=len(story.split('\n\n')), images=len(illustrations), bytes=len(data),
+                               in_memory=in_memory)
         
-        # Clean up generated images
-        for image_file in self.image_cache.values():
-            try:
-                os.remove(image_file)
-            except:
-                pass
+        if in_memory:
+            return BytesIO(data)
         
-        return filename
+        artifact_id = self.artifact_store.put(data, {"user_input": user_input})
+        return f"{artifact_id}.pdf"
 
-    def display_story(self, story: str, feedback: dict, user_input: str):
-        """Display the story and feedback in a nice format."""
+    @property
+    def pdf_pool(self):
+        """Process pool PDFs are rendered in, or None to render in this thread."""
+        if self._pdf_pool is None and self.pdf_backend == "process":
+            self._pdf_pool = get_pdf_pool()
+        return self._pdf_pool
+
+    @property
+    def artifact_store(self) -> ArtifactStore:
+        """Store for saved PDFs, created on first use so in-memory setups never touch the disk."""
+        if self._artifact_store is None:
+            self._artifact_store = ArtifactStore()
+        return self._artifact_store
+
+    def display_story(self, story: str, feedback: dict, user_input: str, pdf_filename: str = None):
+        """Display the story and feedback in a nice format.
+
+        Pass pdf_filename when the story's PDF has already been built.
+        """
+        from rich.panel import Panel
+        from rich.markdown import Markdown
+        
+        console = get_console()
         console.print("\n")
         console.print(Panel(Markdown(story), title="Your Bedtime Story", border_style="blue"))
         
@@ -882,14 +763,28 @@ Provide the response in valid JSON format with these exact keys: age_appropriate
                 console.print(feedback["suggestions"])
             
             # Generate PDF
-            pdf_filename = self.generate_pdf(story, feedback, user_input)
-            console.print(f"\n[green]Your story has been saved as: {pdf_filename}[/green]")
+            pdf_filename = pdf_filename or self.generate_pdf(story, feedback, user_input)
+            pdf_path = self.artifact_store.get_path(ArtifactStore.id_from_filename(pdf_filename))
+            console.print(f"\n[green]Your story has been saved as: {pdf_path}[/green]")
 
 def main():
+    from rich.logging import RichHandler
+    
+    console = get_console()
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(message)s",
+        handlers=[RichHandler(console=console, show_path=False)]
+    )
+    
     console.print("[bold blue]Welcome to the Magical Story Generator![/bold blue]")
     console.print("I'll create a special bedtime story just for you! 🎨✨")
     
     generator = StoryGenerator()
+    # Only warmed after the first surprise, so sessions that never ask for one don't
+    # pay for random stories, and kept small since one person reads one at a time
+    from surprise_pool import SurprisePool, SURPRISE_POOL_SIZE
+    surprise_pool = SurprisePool(generator, size=min(SURPRISE_POOL_SIZE, 2))
     
     while True:
         console.print("\n[bold]What kind of story would you like to hear?[/bold]")
@@ -902,27 +797,29 @@ def main():
         if user_input.lower() == 'exit':
             break
             
-        if user_input.lower() in ['2', 'surprise me', 'random', 'random story']:
-            # Generate a random story prompt
-            random_prompts = [
-                "A magical garden where flowers can talk",
-                "A young dragon learning to fly",
-                "A friendly robot making new friends",
-                "A space adventure with talking planets",
-                "A magical library where books come to life",
-                "A young wizard's first spell",
-                "A friendly monster under the bed",
-                "A journey to the center of a rainbow",
-                "A day in the life of a cloud",
-                "A magical treehouse in the forest"
-            ]
-            user_input = random.choice(random_prompts)
+        surprise_me = user_input.lower() in ['2', 'surprise me', 'random', 'random story']
+        if surprise_me:
+            surprise = surprise_pool.take()
+            if surprise is not None:
+                # One is ready: no waiting at all
+                console.print(f"\n[bold]Here's a story about: {surprise['prompt']}[/bold]")
+                generator.display_story(surprise["story"], surprise["feedback"], surprise["prompt"],
+                                        pdf_filename=surprise["pdf_filename"])
+                console.print("\n[bold]Would you like another story?[/bold]")
+                continue
+            # Nothing ready yet, so write one now
+            user_input = surprise_pool.random_prompt()
             console.print(f"\n[bold]I'll create a story about: {user_input}[/bold]")
             
         with console.status("[bold green]Creating your magical story...[/bold green]"):
-            story, feedback = generator.generate_story(user_input)
+            # The random prompts repeat by design, so never hand back an earlier story for one
+            story, feedback = generator.generate_story(user_input, reuse=not surprise_me)
             generator.display_story(story, feedback, user_input)
         
+        if surprise_me:
+            # Written cold; have the next ones ready without competing with this one
+            surprise_pool.start()
+        
         console.print("\n[bold]Would you like another story?[/bold]")
 
 if __name__ == "__main__":
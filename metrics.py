@@ -0,0 +1,163 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds; model calls run from milliseconds to minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of series, one per combination of label values."""
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key in sorted(self._series, key=lambda k: [str(v) for _, v in k]):
+                lines.extend(self._render_series(key, self._series[key]))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the body of the with block takes."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_series(self, key, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, series["counts"]):
+            cumulative += count
+            labels = key + (("le", _format_value(float(bound))),)
+            lines.append(f"{self.name}_bucket{_format_labels(labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Call collect() at render time for extra (name, type, help, {labels: value}) gauges."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, documentation, samples in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples.items():
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "story_stage_duration_seconds", "Time spent in each pipeline stage.", ["stage"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "story_stage_errors_total", "Pipeline stages that failed.", ["stage"]))
+MODEL_TOKENS = REGISTRY.register(Counter(
+    "openai_tokens_total", "Tokens used by chat completions, by pipeline stage.", ["stage", "kind"]))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "cache_lookups_total", "Response and image cache lookups.", ["cache", "result"]))
+API_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "openai_request_duration_seconds", "Time per HTTP attempt against the OpenAI API.", ["endpoint"]))
+API_REQUESTS = REGISTRY.register(Counter(
+    "openai_requests_total", "HTTP attempts against the OpenAI API, by response status.", ["endpoint", "status"]))
+API_RETRIES = REGISTRY.register(Counter(
+    "openai_retries_total", "Retried OpenAI API attempts.", ["endpoint"]))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Record a pipeline stage's latency, and count it as an error if it raises."""
+    try:
+        with STAGE_SECONDS.time(stage=stage):
+            yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
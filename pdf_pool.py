@@ -0,0 +1,140 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from pdf_renderer import render_pdf
+
+# Where generate_pdf lays out PDFs: "process" (a pool of worker processes) or "inline"
+PDF_RENDER_BACKEND = os.getenv("PDF_RENDER_BACKEND", "process")
+# Worker processes rendering PDFs
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Renders allowed to wait for a worker before new ones are refused
+PDF_QUEUE_SIZE = int(os.getenv("PDF_QUEUE_SIZE", "16"))
+# Seconds a render may take once a worker has picked it up before it is abandoned;
+# time spent queued for a free worker doesn't count
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "60"))
+# Renders per worker process before the pool is recycled, to cap memory growth
+PDF_WORKER_MAX_TASKS = int(os.getenv("PDF_WORKER_MAX_TASKS", "50"))
+
+logger = logging.getLogger(__name__)
+
+
+class PdfPoolError(Exception):
+    """Base class for renders the pool could not complete."""
+
+
+class PdfPoolFullError(PdfPoolError):
+    """Raised when a render is requested while the queue is at capacity."""
+
+
+class PdfRenderTimeout(PdfPoolError):
+    """Raised when a render takes longer than the pool's timeout."""
+
+
+class PdfWorkerError(PdfPoolError):
+    """Raised when the worker process rendering a PDF died, or was killed to stop another render."""
+
+
+def _render(payload: dict) -> bytes:
+    return render_pdf(payload["story"], payload["feedback"], payload["user_input"], payload["images"])
+
+
+class PdfRenderPool:
+    """Renders PDFs in worker processes so reportlab doesn't hold the web process's GIL.
+
+    Payloads are plain dicts (story, feedback, user_input and images, where images
+    maps paragraph indexes to image bytes or file paths). At most workers + max_queue
+    renders are accepted at once, and the rest wait here until a worker is free, so the
+    timeout covers the render alone. A render that overruns the timeout has its workers
+    killed and the pool replaced, since a process pool can't stop a single task; the
+    other renders killed with it are retried once on the new pool.
+    After workers * max_tasks_per_worker renders the pool is retired (its queued
+    renders still finish) and a fresh one started, to cap memory growth.
+    """
+
+    def __init__(self, workers: int = PDF_WORKERS, max_queue: int = PDF_QUEUE_SIZE,
+                 timeout: float = PDF_RENDER_TIMEOUT, max_tasks_per_worker: int = PDF_WORKER_MAX_TASKS):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, max_queue))
+        # Renders only reach the executor once a worker is free, so the timeout excludes queueing
+        self._free_workers = threading.Semaphore(self.workers)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._renders = 0
+
+    def render(self, payload: dict, timeout: float = None) -> bytes:
+        """Render a payload in a worker process and return the PDF bytes."""
+        if not self._slots.acquire(blocking=False):
+            raise PdfPoolFullError("Too many PDFs are being rendered, please try again shortly")
+        try:
+            for attempt in range(2):
+                with self._free_workers:
+                    executor = self._get_executor()
+                    future = executor.submit(_render, payload)
+                    try:
+                        return future.result(timeout=timeout or self.timeout)
+                    except FutureTimeoutError:
+                        self._replace(executor)
+                        raise PdfRenderTimeout(f"Rendering the PDF took longer than {timeout or self.timeout:g}s")
+                    except BrokenProcessPool as e:
+                        if not self._replace(executor) and attempt == 0:
+                            # Killed along with a render that overran, or a worker that died; try once more
+                            continue
+                        raise PdfWorkerError("The PDF renderer stopped unexpectedly, please try again") from e
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # max_tasks_per_child needs Python 3.11, so recycle the whole pool instead
+            if (self._executor is not None and self.max_tasks_per_worker > 0
+                    and self._renders >= self.workers * self.max_tasks_per_worker):
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._executor is None:
+                # spawn, not fork: the web process is running threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                self._renders = 0
+            self._renders += 1
+            return self._executor
+
+    def _replace(self, executor: ProcessPoolExecutor) -> bool:
+        """Kill an executor's workers and stop using it; False if another render already had."""
+        with self._lock:
+            current = self._executor is executor
+            if current:
+                self._executor = None
+        if current:
+            logger.warning("Restarting the PDF render pool")
+        # ProcessPoolExecutor has no public way to stop a running task
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+        return current
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pdf_pool() -> PdfRenderPool:
+    """The process-wide render pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PdfRenderPool()
+        return _pool
@@ -0,0 +1,126 @@
+import logging
+from io import BytesIO
+
+from image_processing import PDF_IMAGE_POINTS
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_METRICS = [
+    ("Age Appropriateness", "age_appropriateness"),
+    ("Story Structure", "story_structure"),
+    ("Educational Value", "educational_value"),
+    ("Entertainment Value", "entertainment_value"),
+    ("Language Clarity", "language_clarity"),
+    ("Length Appropriateness", "length_appropriateness"),
+    ("Emotional Tone", "emotional_tone"),
+    ("Character Development", "character_development"),
+    ("Setting and Atmosphere", "setting_atmosphere"),
+    ("Dialogue Quality", "dialogue_quality"),
+    ("Sensory Details", "sensory_details"),
+    ("Overall Score", "overall_score"),
+]
+
+
+def render_pdf(story: str, feedback: dict, user_input: str, images: dict = None) -> bytes:
+    """Lay out a story as a PDF and return the file's bytes.
+
+    images maps paragraph indexes (in story.split('\\n\\n')) to the illustration drawn
+    after that paragraph, as image bytes or a file path. Everything here is plain data,
+    so this can run in another process.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
+
+    images = images or {}
+    buffer = BytesIO()
+
+    # Create the PDF document
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+
+    # Create custom styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        textColor=colors.HexColor('#2E4053')
+    )
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Heading2'],
+        fontSize=16,
+        spaceAfter=20,
+        textColor=colors.HexColor('#566573')
+    )
+    body_style = ParagraphStyle(
+        'CustomBody',
+        parent=styles['Normal'],
+        fontSize=12,
+        spaceAfter=12,
+        leading=18
+    )
+    feedback_style = ParagraphStyle(
+        'CustomFeedback',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.HexColor('#7F8C8D'),
+        spaceAfter=12
+    )
+
+    # Build the PDF content
+    story_content = []
+
+    # Add title
+    story_content.append(Paragraph("A Magical Bedtime Story", title_style))
+    story_content.append(Spacer(1, 20))
+
+    # Add subtitle with the story request
+    story_content.append(Paragraph(f"Based on: {user_input}", subtitle_style))
+    story_content.append(Spacer(1, 30))
+
+    for i, paragraph in enumerate(story.split('\n\n')):
+        if paragraph.strip():
+            # Add story paragraph
+            story_content.append(Paragraph(paragraph, body_style))
+            story_content.append(Spacer(1, 12))
+
+            # Add image if we have it
+            if i in images:
+                image = images[i]
+                try:
+                    img = Image(
+                        BytesIO(image) if isinstance(image, bytes) else image,
+                        width=PDF_IMAGE_POINTS,
+                        height=PDF_IMAGE_POINTS
+                    )
+                    story_content.append(img)
+                    story_content.append(Spacer(1, 20))
+                except Exception as e:
+                    logger.warning(f"Could not add image to PDF: {str(e)}")
+
+    # Add feedback section if available
+    if feedback and "error" not in feedback:
+        story_content.append(Spacer(1, 30))
+        story_content.append(Paragraph("Story Evaluation", subtitle_style))
+
+        for metric, key in FEEDBACK_METRICS:
+            story_content.append(Paragraph(f"{metric}: {feedback.get(key, 'N/A')}/10", feedback_style))
+
+        if "suggestions" in feedback:
+            story_content.append(Spacer(1, 12))
+            story_content.append(Paragraph("Suggestions for Improvement:", feedback_style))
+            story_content.append(Paragraph(feedback["suggestions"], feedback_style))
+
+    # Build the PDF
+    doc.build(story_content)
+    return buffer.getvalue()
@@ -0,0 +1,311 @@
+from story_arcs import STORY_ARCS, AGE_CATEGORIES
+
+# Marks where the user's request goes; everything else is filled in ahead of time
+USER_INPUT_MARKER = "\x00user_input\x00"
+
+STORY_PROMPT_TEMPLATE = """Create a rich, detailed, and engaging bedtime story (for ages 5-10) based on the following request: "{user_input}"
+
+IMPORTANT: The story MUST be between 1500-2000 words in length. This is a strict requirement.
+
+Story Arc: {arc_name}
+Description: {arc_description}
+Themes: {themes}
+
+Story Structure:
+{story_structure}
+
+Detailed Requirements:
+1. Character Development and Growth:
+   - Give EVERY character a unique name and personality
+   - Include detailed physical descriptions and unique traits
+   - Show character growth THROUGHOUT the story, not just at the end
+   - For the main character, show:
+     * What they believe or know at the start
+     * How their understanding changes with each challenge
+     * Small lessons learned from each encounter
+     * How their perspective shifts throughout the story
+     * What mistakes they make and what they learn from them
+   - For each new character introduced:
+     * Describe exactly how and where they meet
+     * Show their first interaction in detail
+     * Include their initial reaction to each other
+     * Describe their unique way of speaking and moving
+     * Show how their relationship develops
+   - Add meaningful dialogue that reveals character growth
+   - When introducing new characters, give them names and describe their appearance
+
+2. Setting and Atmosphere:
+   - Create vivid, sensory-rich descriptions of locations
+   - Use all five senses in descriptions (sight, sound, smell, touch, taste)
+   - Include weather, time of day, and environmental details
+   - Make the setting feel alive and interactive
+   - Describe how the setting changes as the story progresses
+
+3. Plot and Structure:
+   - Follow the story arc structure while adding rich details
+   - NEVER use vague descriptions like "faced challenges" or "overcame obstacles"
+   - For each challenge, describe:
+     * Exactly what the challenge was
+     * How it looked, sounded, and felt
+     * Why it was difficult
+     * How the characters solved it
+     * What they learned from it
+   - For example, instead of "they solved riddles", write:
+     * The specific riddle they had to solve
+     * How they figured it out
+     * What made it tricky
+     * What they learned about themselves or others
+     * Show the exact moment of realization
+     * Include the actual riddle and solution
+     * Show the characters' thought process
+     * Include their discussion about the riddle
+   - For bridges or obstacles, describe:
+     * What made them dangerous (rotting wood, missing planks, etc.)
+     * How the characters overcame them
+     * What they felt while doing it
+     * What they learned about courage or perseverance
+     * Show the specific steps they took to cross
+     * Include any tools or help they used
+     * Describe the physical sensations (sweaty palms, racing heart, etc.)
+     * Show how they supported each other
+   - For each challenge, show:
+     * The initial attempt
+     * What went wrong (if anything)
+     * How they adjusted their approach
+     * The final solution
+     * What they learned from the process
+     * The emotional impact on each character
+   - For each new character introduced:
+     * Show their first meeting in detail
+     * Include their initial conversation
+     * Describe how they decide to work together
+     * Show their unique contributions to the team
+   - Create clear cause-and-effect relationships
+   - Build tension and resolution naturally
+   - Show the thought process behind each solution
+   - Include specific dialogue during challenges
+   - Show how each character contributes to solving problems
+
+4. Language and Style:
+   - Use age-appropriate but engaging vocabulary
+   - Include descriptive adjectives and adverbs
+   - Vary sentence structure for rhythm
+   - Add gentle humor where appropriate
+   - Use metaphors and similes suitable for children
+   - Create vivid imagery that brings scenes to life
+
+5. Emotional Engagement:
+   - Create emotional moments that resonate
+   - Show characters' feelings through actions and dialogue
+   - Include moments of wonder and discovery
+   - Balance excitement with calm moments
+   - Show how emotions change as characters learn and grow
+   - Include moments of tension and release
+
+6. Educational Elements and Life Lessons:
+   - Include a clear, meaningful moral or life lesson that children can understand and apply
+   - The lesson should be naturally woven into the story, not just stated at the end
+   - Show the consequences of both good and bad choices
+   - Demonstrate positive values like:
+     * Perseverance and never giving up
+     * Kindness and empathy
+     * Courage in the face of fear
+     * Friendship and teamwork
+     * Honesty and trust
+     * Responsibility and consequences
+     * Self-confidence and believing in oneself
+   - Make the lesson relatable to children's everyday lives
+   - Show how the characters grow and learn from their experiences
+   - Include multiple small lessons throughout the story
+   - Show exactly how each lesson is learned through specific events
+
+7. Story Length and Pacing:
+   - The story MUST be between 1500-2000 words in length
+   - This is a strict requirement - do not make the story shorter
+   - Balance action scenes with quieter moments
+   - Include enough detail to paint vivid pictures
+   - Maintain steady pacing throughout
+   - Allow time for reflection and learning
+   - Give each scene enough space to develop fully
+   - Ensure each character interaction and challenge is fully developed
+   - Include enough detail to make the story immersive and engaging
+   - Each major scene should be at least 200-300 words
+   - Each character introduction should be at least 150-200 words
+   - Each challenge and its resolution should be at least 250-300 words
+
+8. Dialogue Requirements:
+   - Make dialogue natural and character-specific
+   - Include emotional expressions
+   - Use dialogue to advance the plot
+   - Show relationships through conversation
+   - Give each character a unique way of speaking
+   - Use dialogue to show learning and growth
+   - Include meaningful conversations that reveal character
+
+9. Sensory Details:
+   - Describe how things look, sound, feel, smell, and taste
+   - Include environmental sounds and textures
+   - Add weather and time-of-day details
+   - Make the world feel tangible and real
+   - Use sensory details to create atmosphere
+
+10. Ending Requirements:
+    - Provide a satisfying conclusion that reinforces the story's moral
+    - Show how the characters have grown and learned
+    - Include a clear but gentle reminder of the lesson learned
+    - Leave room for imagination while ensuring the message is clear
+    - End with a positive, hopeful note that encourages children to apply the lesson
+    - Show how the main character's understanding has changed from the beginning
+    - Tie up all major story threads
+
+11. Specific Encounters:
+    - For each challenge, include:
+      * The exact nature of the challenge
+      * What made it difficult or dangerous
+      * How the characters felt about it
+      * The specific steps they took to overcome it
+      * What they learned from it
+      * How their understanding changed
+    - Make each encounter unique and memorable
+    - Show the consequences of their actions
+    - Connect each challenge to the story's main lesson
+    - Show how each challenge contributes to the character's growth
+    - Include specific details that make each encounter special
+
+Format the story with clear paragraphs, engaging dialogue, and rich descriptions. Make each scene come alive with specific details and sensory information. Remember to name every character and describe specific encounters rather than using general terms. NEVER use vague phrases like "faced challenges" or "overcame obstacles" - always describe exactly what happened. Most importantly, ensure the story shows the main character learning and growing throughout the journey, not just at the end. Make each scene detailed and specific, showing exactly how characters meet, interact, and learn from each other.
+
+IMPORTANT: The story MUST be between 1500-2000 words in length. This is a strict requirement."""
+
+
+def build_story_structure(arc_info, age_category: str) -> str:
+    """Describe each stage of an arc for the given age group."""
+    return "\n".join([
+        f"\n{stage['name']}:\n"
+        f"Purpose: {stage['description']}\n"
+        f"Emotional Tone: {stage['emotional_tone']}\n"
+        f"Age-Appropriate Approach: {stage['age_adaptations'][age_category]}"
+        for stage in arc_info['stages']
+    ])
+
+
+def compile_story_prompt(arc_info, age_category: str) -> tuple:
+    """Fill in everything but the user's request, returning the text before and after it."""
+    prompt = STORY_PROMPT_TEMPLATE.format(
+        user_input=USER_INPUT_MARKER,
+        arc_name=arc_info['name'],
+        arc_description=arc_info['description'],
+        themes=', '.join(arc_info['themes']),
+        story_structure=build_story_structure(arc_info, age_category)
+    )
+    head, tail = prompt.split(USER_INPUT_MARKER)
+    return head, tail
+
+
+# Precompiled story prompts for every (arc, age category) pair
+STORY_PROMPTS = {
+    (arc_key, age_category): compile_story_prompt(arc_info, age_category)
+    for arc_key, arc_info in STORY_ARCS.items()
+    for age_category in AGE_CATEGORIES
+}
+
+
+def story_prompt(arc_key: str, age_category: str, user_input: str) -> str:
+    """Build the story prompt for a request from its precompiled parts."""
+    head, tail = STORY_PROMPTS[(arc_key, age_category)]
+    return head + user_input + tail
+
+
+# Words the whole story should come to when it is written section by section
+OUTLINE_STORY_WORDS = 1750
+
+OUTLINE_PROMPT_TEMPLATE = """Plan a bedtime story (for ages {age_category}) based on the following request: "{user_input}"
+
+Story Arc: {arc_name}
+Description: {arc_description}
+Themes: {themes}
+
+The story has exactly these stages, in order:
+{story_structure}
+
+Respond with valid JSON only, using these keys:
+- "title": the story's title
+- "setting": two or three sentences describing where and when the story happens
+- "characters": a list of objects with "name", "appearance", "personality" and "way_of_speaking"; give EVERY character a unique name
+- "lesson": the moral or life lesson the story teaches
+- "sections": one object per stage above, in the same order, with "stage" (the stage name) and "summary" (three to five sentences saying exactly what happens, who is there and what is learned)
+
+Keep the plan compact: it is shared with several writers who will each write one stage."""
+
+SECTION_PROMPT_TEMPLATE = """You are writing one part of a bedtime story (for ages {age_category}) based on the request: "{user_input}". Other writers are writing the other parts at the same time from the same plan, so follow the plan exactly and keep every name, appearance and detail consistent with it.
+
+Story plan:
+{outline}
+
+Write ONLY part {number} of {total}, the "{stage_name}" stage.
+Purpose: {stage_description}
+Emotional Tone: {emotional_tone}
+Age-Appropriate Approach: {age_adaptation}
+What happens: {summary}
+
+Requirements:
+- About {words} words of story text, in clear paragraphs
+- Vivid sensory details, specific events (never vague phrases like "faced challenges") and natural, character-specific dialogue
+- Show the main character learning and changing during this part
+- {position}
+- No title, heading, part number or commentary; only the story text"""
+
+CONTINUITY_PROMPT_TEMPLATE = """These are the boundaries between consecutive parts of a bedtime story that were written separately. For each boundary, write one or two short sentences that lead smoothly from the end of the first part into the start of the next, without repeating either.
+
+{boundaries}
+
+Respond with valid JSON only: a list of {count} strings, one per boundary, in order."""
+
+
+def outline_prompt(arc_key: str, age_category: str, user_input: str) -> str:
+    """Prompt for the story plan: setting, character bible and a summary per arc stage."""
+    arc_info = STORY_ARCS[arc_key]
+    return OUTLINE_PROMPT_TEMPLATE.format(
+        user_input=user_input,
+        age_category=age_category,
+        arc_name=arc_info['name'],
+        arc_description=arc_info['description'],
+        themes=', '.join(arc_info['themes']),
+        story_structure=build_story_structure(arc_info, age_category)
+    )
+
+
+def section_prompt(arc_key: str, age_category: str, user_input: str, outline: str,
+                   index: int, summary: str = "") -> str:
+    """Prompt for the section of the story covering the arc stage at index."""
+    stages = STORY_ARCS[arc_key]['stages']
+    stage = stages[index]
+    if index == 0:
+        position = "This is the opening: introduce the setting and main character"
+    elif index == len(stages) - 1:
+        position = "This is the ending: tie up every thread and close gently with the lesson learned"
+    else:
+        position = "Pick up where the previous part left off and don't end the story"
+    return SECTION_PROMPT_TEMPLATE.format(
+        user_input=user_input,
+        age_category=age_category,
+        outline=outline,
+        number=index + 1,
+        total=len(stages),
+        stage_name=stage['name'],
+        stage_description=stage['description'],
+        emotional_tone=stage['emotional_tone'],
+        age_adaptation=stage['age_adaptations'][age_category],
+        summary=summary or "Follow the plan for this stage",
+        words=OUTLINE_STORY_WORDS // len(stages),
+        position=position
+    )
+
+
+def continuity_prompt(sections) -> str:
+    """Prompt for transitions between each pair of consecutive sections."""
+    boundaries = []
+    for i in range(len(sections) - 1):
+        end = sections[i].strip().split("\n\n")[-1]
+        start = sections[i + 1].strip().split("\n\n")[0]
+        boundaries.append(f"Boundary {i + 1}:\nEnd of part {i + 1}: {end}\nStart of part {i + 2}: {start}")
+    return CONTINUITY_PROMPT_TEMPLATE.format(boundaries="\n\n".join(boundaries), count=len(boundaries))
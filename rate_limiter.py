@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Limits for the chat endpoint (requests and tokens per minute, calls in flight at once)
+CHAT_RPM = float(os.getenv("CHAT_RPM", "3500"))
+CHAT_TPM = float(os.getenv("CHAT_TPM", "90000"))
+CHAT_MAX_CONCURRENT = int(os.getenv("CHAT_MAX_CONCURRENT", "16"))
+# Limits for the image endpoint; images are counted as requests
+IMAGE_RPM = float(os.getenv("IMAGE_RPM", "50"))
+IMAGE_MAX_CONCURRENT = int(os.getenv("IMAGE_MAX_CONCURRENT", "8"))
+
+# Number of recent waits kept for percentile reporting
+WAIT_SAMPLES = 1000
+
+
+class TokenBucket:
+    """Refills continuously at rate_per_minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.level = rate_per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until amount is available (amount is capped at the bucket's capacity)."""
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit / self.rate)
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+class Governor:
+    """Request/token budget and concurrency cap shared by every caller of one API endpoint.
+
+    Callers are served strictly in arrival order: they queue instead of failing, and a
+    large request at the head of the queue is not starved by smaller ones behind it.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float = None,
+                 max_concurrent: int = None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._acquired = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @contextmanager
+    def acquire(self, tokens: float = 0, requests: int = 1):
+        """Wait for a turn, hold an in-flight slot for the body of the with block."""
+        self._wait_for_turn(tokens, requests)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def settle(self, estimated: float, actual: float):
+        """Correct the token budget once the real usage of a call is known."""
+        if self.tokens is None:
+            return
+        with self._cond:
+            self.tokens.refill(time.monotonic())
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+            self._cond.notify_all()
+
+    def _wait_for_turn(self, tokens: float, requests: int):
+        started = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            while True:
+                timeout = None
+                if self._queue[0] is ticket:
+                    timeout = self._time_until_ready(tokens, requests)
+                    if timeout == 0:
+                        break
+                self._cond.wait(timeout)
+            self._queue.popleft()
+            self.requests.take(requests)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+
+            waited = time.monotonic() - started
+            self._acquired += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            self._waits.append(waited)
+            # Let the next caller in line check its own budget
+            self._cond.notify_all()
+
+    def _time_until_ready(self, tokens: float, requests: int):
+        """Seconds until the head of the queue may go, 0 if now, None if waiting on a free slot."""
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            return None
+        now = time.monotonic()
+        self.requests.refill(now)
+        wait = self.requests.time_until(requests)
+        if self.tokens is not None:
+            self.tokens.refill(now)
+            wait = max(wait, self.tokens.time_until(tokens))
+        return wait
+
+    def stats(self) -> dict:
+        """Queueing delay added by the governor, plus current load."""
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                "acquired": self._acquired,
+                "queued": len(self._queue),
+                "in_flight": self.in_flight,
+                "total_wait_seconds": self._total_wait,
+                "max_wait_seconds": self._max_wait,
+                "mean_wait_seconds": self._total_wait / self._acquired if self._acquired else 0.0,
+                "p95_wait_seconds": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            }
+
+
+# Process-wide governors shared by every StoryGenerator
+CHAT_GOVERNOR = Governor("chat", CHAT_RPM, CHAT_TPM, CHAT_MAX_CONCURRENT)
+IMAGE_GOVERNOR = Governor("image", IMAGE_RPM, max_concurrent=IMAGE_MAX_CONCURRENT)
@@ -0,0 +1,419 @@
+from types import MappingProxyType
+
+# Age groups the story structure can be adapted for
+AGE_CATEGORIES = ("5-6", "7-8", "9-10")
+DEFAULT_AGE_CATEGORY = "7-8"
+
+_ARC_DATA = {
+    "hero's_journey": {
+        "name": "Hero's Journey",
+        "stages": [
+            {
+                "name": "Ordinary World",
+                "description": "Introduce the character in their normal, everyday life",
+                "emotional_tone": "comfortable, familiar",
+                "age_adaptations": {
+                    "5-6": "Show simple daily routine (playing, eating, sleeping)",
+                    "7-8": "Include family, friends, and favorite activities",
+                    "9-10": "Add personality traits and small challenges"
+                }
+            },
+            {
+                "name": "Call to Adventure",
+                "description": "Something happens that starts the adventure",
+                "emotional_tone": "exciting, curious",
+                "age_adaptations": {
+                    "5-6": "Simple discovery (lost toy, new friend)",
+                    "7-8": "Invitation to help someone or explore somewhere",
+                    "9-10": "Mystery to solve or challenge to accept"
+                }
+            },
+            {
+                "name": "Journey Begins",
+                "description": "Character starts their adventure",
+                "emotional_tone": "determined, hopeful",
+                "age_adaptations": {
+                    "5-6": "Taking first steps with excitement",
+                    "7-8": "Planning and preparing for the journey",
+                    "9-10": "Showing courage despite uncertainty"
+                }
+            },
+            {
+                "name": "Challenges and Helpers",
+                "description": "Character faces specific obstacles and meets helpers",
+                "emotional_tone": "challenging but hopeful",
+                "age_adaptations": {
+                    "5-6": "Simple problems with friendly helpers",
+                    "7-8": "Puzzles to solve with teammates",
+                    "9-10": "Complex challenges requiring multiple attempts"
+                },
+                "specific_requirements": {
+                    "challenges": [
+                        "Physical obstacle (bridge, mountain, river)",
+                        "Mental challenge (riddle, puzzle, test)",
+                        "Emotional challenge (fear, doubt, loneliness)"
+                    ],
+                    "helpers": [
+                        "Wise mentor with specific knowledge",
+                        "Loyal friend with unique skills",
+                        "Unexpected ally with special abilities"
+                    ],
+                    "interactions": [
+                        "Show how each helper is met",
+                        "Describe their unique appearance and personality",
+                        "Explain how they help with specific challenges"
+                    ]
+                }
+            },
+            {
+                "name": "Victory and Learning",
+                "description": "Character succeeds and learns important lesson",
+                "emotional_tone": "triumphant, wise",
+                "age_adaptations": {
+                    "5-6": "Simple success with clear lesson",
+                    "7-8": "Achievement through perseverance",
+                    "9-10": "Complex victory showing character growth"
+                },
+                "specific_requirements": {
+                    "victory_elements": [
+                        "Show the exact moment of success",
+                        "Describe how the challenge is overcome",
+                        "Include the emotional impact"
+                    ],
+                    "learning_elements": [
+                        "Specific lesson learned",
+                        "How the character changed",
+                        "What they can do now that they couldn't before"
+                    ]
+                }
+            },
+            {
+                "name": "Return Home",
+                "description": "Character returns changed and shares wisdom",
+                "emotional_tone": "satisfied, peaceful",
+                "age_adaptations": {
+                    "5-6": "Happy return with simple sharing",
+                    "7-8": "Sharing adventure with family/friends",
+                    "9-10": "Reflection on growth and change"
+                }
+            }
+        ],
+        "description": "A transformative journey where the hero overcomes challenges and returns changed",
+        "themes": ["courage", "growth", "adventure", "friendship", "perseverance"]
+    },
+    "friendship": {
+        "name": "Friendship Story",
+        "stages": [
+            {
+                "name": "Loneliness or New Situation",
+                "description": "Character needs a friend or meets someone new",
+                "emotional_tone": "hopeful, open",
+                "age_adaptations": {
+                    "5-6": "Want to play with someone new",
+                    "7-8": "Starting school or moving to new place",
+                    "9-10": "Complex social situation requiring friendship"
+                }
+            },
+            {
+                "name": "First Connection",
+                "description": "Characters begin to interact",
+                "emotional_tone": "tentative, curious",
+                "age_adaptations": {
+                    "5-6": "Simple sharing or playing together",
+                    "7-8": "Discovering common interests",
+                    "9-10": "Meaningful conversation or shared experience"
+                }
+            },
+            {
+                "name": "Friendship Challenge",
+                "description": "Specific misunderstanding or conflict arises between friends",
+                "emotional_tone": "sad but hopeful",
+                "age_adaptations": {
+                    "5-6": "Simple disagreement about what to play",
+                    "7-8": "Misunderstanding about intentions",
+                    "9-10": "Complex conflict requiring empathy"
+                },
+                "specific_requirements": {
+                    "conflict_types": [
+                        "Misunderstanding about actions or words",
+                        "Disagreement about how to solve a problem",
+                        "Feeling left out or excluded",
+                        "Different opinions about what to do"
+                    ],
+                    "emotional_impact": [
+                        "Show how each character feels",
+                        "Describe their reactions",
+                        "Include their thoughts about the situation"
+                    ],
+                    "conflict_development": [
+                        "How the problem starts",
+                        "What makes it worse",
+                        "How it affects their friendship"
+                    ]
+                }
+            },
+            {
+                "name": "Understanding and Forgiveness",
+                "description": "Characters work through their differences",
+                "emotional_tone": "understanding, caring",
+                "age_adaptations": {
+                    "5-6": "Simple apology and making up",
+                    "7-8": "Talking through the problem together",
+                    "9-10": "Deep understanding and compromise"
+                },
+                "specific_requirements": {
+                    "resolution_steps": [
+                        "Realizing the misunderstanding",
+                        "Expressing feelings clearly",
+                        "Listening to each other",
+                        "Finding a solution together"
+                    ],
+                    "emotional_growth": [
+                        "Learning to see another's perspective",
+                        "Understanding the importance of communication",
+                        "Developing empathy and understanding"
+                    ],
+                    "reconciliation": [
+                        "Specific words of apology",
+                        "Actions that show forgiveness",
+                        "Plans to prevent future misunderstandings"
+                    ]
+                }
+            },
+            {
+                "name": "Stronger Friendship",
+                "description": "Friendship is stronger after working through challenges",
+                "emotional_tone": "warm, secure",
+                "age_adaptations": {
+                    "5-6": "Playing happily together again",
+                    "7-8": "Celebrating their friendship",
+                    "9-10": "Deeper bond and mutual support"
+                }
+            }
+        ],
+        "description": "A story about the power of friendship and overcoming obstacles together",
+        "themes": ["friendship", "empathy", "communication", "forgiveness", "social skills"]
+    },
+    "three_act": {
+        "name": "Classic Three-Act Story",
+        "stages": [
+            {
+                "name": "Setup",
+                "description": "Introduce characters, setting, and the central conflict",
+                "emotional_tone": "intriguing, engaging",
+                "age_adaptations": {
+                    "5-6": "Simple character and one clear problem",
+                    "7-8": "Character relationships and building tension",
+                    "9-10": "Complex setup with multiple story elements"
+                }
+            },
+            {
+                "name": "Rising Action",
+                "description": "Conflict develops and complications arise",
+                "emotional_tone": "escalating, engaging",
+                "age_adaptations": {
+                    "5-6": "Problem gets a bit bigger but not scary",
+                    "7-8": "Multiple attempts to solve the problem",
+                    "9-10": "Layered complications and character development"
+                }
+            },
+            {
+                "name": "Climax",
+                "description": "The main conflict reaches its peak",
+                "emotional_tone": "intense but appropriate",
+                "age_adaptations": {
+                    "5-6": "Clear moment where problem is solved",
+                    "7-8": "Exciting resolution requiring character's best effort",
+                    "9-10": "Pivotal moment showing character's growth"
+                }
+            },
+            {
+                "name": "Resolution",
+                "description": "Conflicts are resolved and loose ends tied up",
+                "emotional_tone": "resolved, peaceful",
+                "age_adaptations": {
+                    "5-6": "Everything works out happily",
+                    "7-8": "Consequences addressed, lessons learned",
+                    "9-10": "Character reflection and future implications"
+                }
+            }
+        ],
+        "description": "Setup, confrontation, and resolution in three clear parts",
+        "themes": ["conflict resolution", "character development", "cause and effect"]
+    },
+    "problem_solution": {
+        "name": "Problem and Solution",
+        "stages": [
+            {
+                "name": "Happy Beginning",
+                "description": "Character is content in their world",
+                "emotional_tone": "cheerful, content",
+                "age_adaptations": {
+                    "5-6": "Simple, happy activity",
+                    "7-8": "Character enjoying time with others",
+                    "9-10": "Character's normal life with small details"
+                }
+            },
+            {
+                "name": "Problem Appears",
+                "description": "A manageable problem disrupts the happiness",
+                "emotional_tone": "concerned but not scared",
+                "age_adaptations": {
+                    "5-6": "Very simple problem (toy broken, friend sad)",
+                    "7-8": "Problem affecting multiple characters",
+                    "9-10": "Problem requiring thought and planning"
+                }
+            },
+            {
+                "name": "First Attempts",
+                "description": "Character tries to solve the problem",
+                "emotional_tone": "determined, trying",
+                "age_adaptations": {
+                    "5-6": "One simple attempt that almost works",
+                    "7-8": "Two different approaches tried",
+                    "9-10": "Multiple creative solutions attempted"
+                }
+            },
+            {
+                "name": "Breakthrough",
+                "description": "Character finds the right solution",
+                "emotional_tone": "excited, proud",
+                "age_adaptations": {
+                    "5-6": "Simple solution that works perfectly",
+                    "7-8": "Solution that helps everyone involved",
+                    "9-10": "Creative solution showing character growth"
+                }
+            },
+            {
+                "name": "Happy Ending",
+                "description": "Problem solved, everyone happy, lesson learned",
+                "emotional_tone": "joyful, peaceful",
+                "age_adaptations": {
+                    "5-6": "Simple celebration of success",
+                    "7-8": "Sharing success with others",
+                    "9-10": "Reflection on what was learned"
+                }
+            }
+        ],
+        "description": "Simple structure: problem appears, attempts are made, solution found",
+        "themes": ["problem-solving", "persistence", "helping others", "creativity"]
+    },
+    "learning": {
+        "name": "Learning and Growth",
+        "stages": [
+            {
+                "name": "Curiosity or Need",
+                "description": "Character encounters something they want or need to learn",
+                "emotional_tone": "curious, interested",
+                "age_adaptations": {
+                    "5-6": "Want to do something others can do",
+                    "7-8": "Need skill for specific goal or activity",
+                    "9-10": "Complex problem requiring new knowledge"
+                }
+            },
+            {
+                "name": "First Attempts",
+                "description": "Character tries but struggles with new skill",
+                "emotional_tone": "trying, frustrated but not giving up",
+                "age_adaptations": {
+                    "5-6": "One attempt that doesn't work perfectly",
+                    "7-8": "Multiple attempts with gradual improvement",
+                    "9-10": "Complex learning process with setbacks"
+                }
+            },
+            {
+                "name": "Getting Help",
+                "description": "Character seeks or receives guidance",
+                "emotional_tone": "humble, receptive",
+                "age_adaptations": {
+                    "5-6": "Simple help from parent or friend",
+                    "7-8": "Learning from teacher or mentor",
+                    "9-10": "Multiple sources of help and advice"
+                }
+            },
+            {
+                "name": "Practice and Progress",
+                "description": "Character practices and slowly improves",
+                "emotional_tone": "determined, gradually more confident",
+                "age_adaptations": {
+                    "5-6": "Simple practice with visible improvement",
+                    "7-8": "Structured practice with milestones",
+                    "9-10": "Self-directed practice and goal-setting"
+                }
+            },
+            {
+                "name": "Success and Sharing",
+                "description": "Character masters the skill and teaches or helps others",
+                "emotional_tone": "proud, generous",
+                "age_adaptations": {
+                    "5-6": "Simple success and showing others",
+                    "7-8": "Helping friend learn the same skill",
+                    "9-10": "Using new skill to solve problems for others"
+                }
+            }
+        ],
+        "description": "Character learns new skill or concept through experience",
+        "themes": ["learning", "persistence", "growth mindset", "asking for help", "sharing knowledge"]
+    },
+    "bedtime_gentle": {
+        "name": "Gentle Bedtime Journey",
+        "stages": [
+            {
+                "name": "Peaceful Setting",
+                "description": "Establish a calm, beautiful, safe environment",
+                "emotional_tone": "peaceful, serene",
+                "age_adaptations": {
+                    "5-6": "Simple, cozy place like bedroom or garden",
+                    "7-8": "Magical but gentle setting like starlit meadow",
+                    "9-10": "Rich, peaceful world with calming details"
+                }
+            },
+            {
+                "name": "Gentle Activity",
+                "description": "Character engages in calm, pleasant activity",
+                "emotional_tone": "content, relaxed",
+                "age_adaptations": {
+                    "5-6": "Simple activity like watching clouds",
+                    "7-8": "Gentle exploration or quiet conversation",
+                    "9-10": "Thoughtful activity like stargazing"
+                }
+            },
+            {
+                "name": "Quiet Wisdom",
+                "description": "Character learns gentle lesson or gains peaceful insight",
+                "emotional_tone": "wise, calm",
+                "age_adaptations": {
+                    "5-6": "Simple realization about kindness or beauty",
+                    "7-8": "Gentle lesson about nature or friendship",
+                    "9-10": "Deeper insight about life or relationships"
+                }
+            },
+            {
+                "name": "Sleepy Conclusion",
+                "description": "Story winds down with character feeling peaceful and sleepy",
+                "emotional_tone": "drowsy, secure",
+                "age_adaptations": {
+                    "5-6": "Character getting sleepy and cozy",
+                    "7-8": "Peaceful ending with character resting",
+                    "9-10": "Contemplative, drowsy conclusion"
+                }
+            }
+        ],
+        "description": "Calm, soothing story arc designed to help children wind down",
+        "themes": ["peace", "comfort", "nature", "reflection", "security"]
+    }
+}
+
+
+def _freeze(value):
+    """Recursively turn dicts into read-only mappings and lists into tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+# Shared, read-only registry of story arcs, built once per process
+STORY_ARCS = _freeze(_ARC_DATA)
+del _ARC_DATA
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+# Prompts at least this similar (Jaccard over normalised words and word pairs) reuse the earlier story
+STORY_REUSE_THRESHOLD = float(os.getenv("STORY_REUSE_THRESHOLD", "0.7"))
+# Stories kept when the index lives in memory only
+STORY_INDEX_SIZE = int(os.getenv("STORY_INDEX_SIZE", "2000"))
+# Stories kept in the SQLite file; only their prompts are held in memory
+STORY_INDEX_DISK_SIZE = int(os.getenv("STORY_INDEX_DISK_SIZE", "200000"))
+# SQLite file for stories; leave unset to keep them in memory only
+STORY_INDEX_DB = os.getenv("STORY_INDEX_DB")
+
+# MinHash signature length, split into LSH bands of MINHASH_PERMUTATIONS // LSH_BANDS rows.
+# 16 bands of 4 rows find pairs at 0.7 similarity 98.8% of the time and at 0.2 only 2.5%.
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MASK64 = (1 << 64) - 1
+# Bumped whenever prompt_tokens changes, so a database built with the old tokens is cleared
+_INDEX_VERSION = 2
+
+STOPWORDS = frozenset("""
+a an the and or but of to in on at by for with about into from over under up down
+is are was were be been being am do does did has have had can could will would should
+me my i you your we our us it its they them their he him his she her this that these those
+story tale please write tell make create some any very just who which what where when
+""".split())
+
+# Words that flip a prompt's meaning; two prompts only match if they use the same ones
+NEGATIONS = frozenset("not no never nobody nothing nowhere neither nor without".split())
+
+
+def _stem(word: str) -> str:
+    """Strip common English suffixes so "learns", "learning" and "learned", or "dogs" and "dog", match."""
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    if word.endswith("s") and not word.endswith("ss") and len(word) >= 4:
+        return word[:-1]
+    return word
+
+
+def prompt_tokens(text: str) -> frozenset:
+    """The normalised shingles of a prompt: its content words and each pair of neighbouring ones.
+
+    Words are lowercased, unpunctuated and stemmed, and stopwords dropped. The word
+    pairs make order count, so "a princess who saves a knight" doesn't match "a knight
+    who saves a princess".
+    """
+    text = text.lower().replace("n't", " not").replace("cannot", "can not").replace("'", "")
+    words = [_stem(word) for word in re.findall(r"[a-z0-9]+", text) if word not in STOPWORDS]
+    return frozenset(words) | frozenset(f"{a}_{b}" for a, b in zip(words, words[1:]))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class StoryIndex:
+    """Finds earlier stories written for nearly the same prompt.
+
+    Prompts are reduced to sets of normalised words and word pairs and indexed with
+    MinHash and locality-sensitive hashing, so a lookup only compares against the few
+    prompts sharing a band bucket, however many are stored. Candidates are confirmed
+    with their exact Jaccard similarity and must use the same negation words. With a
+    db_path, stories live in SQLite and only the word sets and buckets are kept in
+    memory; the oldest entries are evicted.
+    """
+
+    def __init__(self, threshold: float = STORY_REUSE_THRESHOLD, max_entries: int = STORY_INDEX_SIZE,
+                 db_path: str = STORY_INDEX_DB, max_disk_entries: int = STORY_INDEX_DISK_SIZE,
+                 permutations: int = MINHASH_PERMUTATIONS, bands: int = LSH_BANDS):
+        self.threshold = threshold
+        self.max_entries = max_disk_entries if db_path else max_entries
+        self.bands = bands
+        self.rows = permutations // bands
+        generator = random.Random(0)
+        self._permutations = [(generator.randrange(1, _MERSENNE_PRIME), generator.randrange(_MERSENNE_PRIME))
+                              for _ in range(self.bands * self.rows)]
+        self.hits = 0
+        self.misses = 0
+        self._tokens = OrderedDict()
+        self._stories = {}
+        self._buckets = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            import sqlite3
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS stories ("
+                "id INTEGER PRIMARY KEY, user_input TEXT NOT NULL, tokens TEXT NOT NULL, "
+                "band_keys BLOB NOT NULL, story TEXT NOT NULL, feedback TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != _INDEX_VERSION:
+                self._db.execute("DELETE FROM stories")
+                self._db.execute(f"PRAGMA user_version = {_INDEX_VERSION}")
+            self._db.commit()
+            # The stored bucket keys save recomputing every signature at startup
+            key_format = f"{self.bands}Q"
+            rows = self._db.execute("SELECT id, tokens, band_keys FROM stories ORDER BY id")
+            for entry_id, tokens, band_keys in rows:
+                self._index(entry_id, frozenset(tokens.split()), struct.unpack(key_format, band_keys))
+                self._next_id = entry_id + 1
+
+    def _band_keys(self, tokens: frozenset) -> list:
+        """One bucket key per LSH band, from the MinHash signature of tokens."""
+        hashes = [int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+                  for token in tokens]
+        signature = [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._permutations]
+        keys = []
+        for band in range(self.bands):
+            key = band
+            for value in signature[band * self.rows:(band + 1) * self.rows]:
+                key = ((key * 1000003) ^ value) & _MASK64
+            keys.append(key)
+        return keys
+
+    def _index(self, entry_id: int, tokens: frozenset, band_keys):
+        self._tokens[entry_id] = tokens
+        for key in band_keys:
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+    def _forget(self, entry_id: int):
+        tokens = self._tokens.pop(entry_id)
+        self._stories.pop(entry_id, None)
+        for key in self._band_keys(tokens):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def lookup(self, user_input: str):
+        """Return the stored entry most similar to user_input above the threshold, or None.
+
+        The entry is a dict with user_input, story, feedback and similarity.
+        """
+        tokens = prompt_tokens(user_input)
+        if not tokens:
+            return None
+        band_keys = self._band_keys(tokens)
+        with self._lock:
+            candidates = set()
+            for key in band_keys:
+                candidates.update(self._buckets.get(key, ()))
+            best_id, best_similarity = None, 0.0
+            negations = tokens & NEGATIONS
+            for entry_id in candidates:
+                if self._tokens[entry_id] & NEGATIONS != negations:
+                    continue
+                similarity = jaccard(tokens, self._tokens[entry_id])
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT user_input, story, feedback FROM stories WHERE id = ?", (best_id,)
+                ).fetchone()
+                entry = {"user_input": row[0], "story": row[1], "feedback": json.loads(row[2])}
+            else:
+                entry = dict(self._stories[best_id])
+            self.hits += 1
+        entry["similarity"] = best_similarity
+        return entry
+
+    def add(self, user_input: str, story: str, feedback: dict):
+        """Index a finished story under its prompt, evicting the oldest entries beyond the limit."""
+        tokens = prompt_tokens(user_input)
+        if not tokens or self.max_entries <= 0:
+            return
+        band_keys = self._band_keys(tokens)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index(entry_id, tokens, band_keys)
+            evicted = []
+            while len(self._tokens) > self.max_entries:
+                oldest = next(iter(self._tokens))
+                self._forget(oldest)
+                evicted.append(oldest)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO stories (id, user_input, tokens, band_keys, story, feedback, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (entry_id, user_input, " ".join(sorted(tokens)), struct.pack(f"{self.bands}Q", *band_keys),
+                     story, json.dumps(feedback), time.time())
+                )
+                self._db.executemany("DELETE FROM stories WHERE id = ?", [(i,) for i in evicted])
+                self._db.commit()
+            else:
+                self._stories[entry_id] = {"user_input": user_input, "story": story, "feedback": feedback}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._tokens),
+            }
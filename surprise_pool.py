@@ -0,0 +1,138 @@
+import logging
+import os
+import random
+import threading
+import time
+
+# Ready-made "Surprise me" stories kept in stock (0 turns the warmer off)
+SURPRISE_POOL_SIZE = int(os.getenv("SURPRISE_POOL_SIZE", "5"))
+# Stories in stock longer than this are replaced with fresh ones
+SURPRISE_MAX_AGE_SECONDS = float(os.getenv("SURPRISE_MAX_AGE_SECONDS", "21600"))
+# Pause after a failed generation before the warmer tries again
+SURPRISE_RETRY_SECONDS = 30
+
+RANDOM_PROMPTS = [
+    "A magical garden where flowers can talk",
+    "A young dragon learning to fly",
+    "A friendly robot making new friends",
+    "A space adventure with talking planets",
+    "A magical library where books come to life",
+    "A young wizard's first spell",
+    "A friendly monster under the bed",
+    "A journey to the center of a rainbow",
+    "A day in the life of a cloud",
+    "A magical treehouse in the forest"
+]
+
+logger = logging.getLogger(__name__)
+
+
+class SurprisePool:
+    """Keeps finished random stories (story, feedback and PDF) ready to hand out instantly.
+
+    Once start() is called, a background thread tops the stock up whenever a story
+    is taken or goes stale, spreading it across the prompts. Each story is handed
+    out once, and take() prefers the prompt served least recently, so repeats are rare.
+    """
+
+    def __init__(self, generator, size: int = SURPRISE_POOL_SIZE, prompts=RANDOM_PROMPTS,
+                 max_age: float = SURPRISE_MAX_AGE_SECONDS, with_pdf: bool = True):
+        self.generator = generator
+        self.size = size
+        self.prompts = list(prompts)
+        self.max_age = max_age
+        self.with_pdf = with_pdf
+        self._stock = []
+        self._last_served = {prompt: 0.0 for prompt in self.prompts}
+        self._served = 0
+        self._misses = 0
+        self._cond = threading.Condition()
+        self._started = False
+
+    def start(self):
+        """Start the background warmer; later calls do nothing.
+
+        Not done on construction, so importing a module that builds a pool (including
+        the re-import in every spawned PDF worker) never starts paying for stories.
+        """
+        with self._cond:
+            if self._started or self.size <= 0:
+                return
+            self._started = True
+        threading.Thread(target=self._warm, name="surprise-warmer", daemon=True).start()
+
+    def random_prompt(self) -> str:
+        return random.choice(self.prompts)
+
+    def take(self):
+        """Hand out a ready story as a dict, or None if the stock is empty."""
+        with self._cond:
+            self._drop_stale()
+            if not self._stock:
+                self._misses += 1
+                return None
+            least_recent = min(self._last_served[entry["prompt"]] for entry in self._stock)
+            choices = [entry for entry in self._stock if self._last_served[entry["prompt"]] == least_recent]
+            entry = random.choice(choices)
+            self._stock.remove(entry)
+            self._last_served[entry["prompt"]] = time.time()
+            self._served += 1
+            # Wake the warmer to replace it
+            self._cond.notify_all()
+            return entry
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "stock": len(self._stock),
+                "served": self._served,
+                "misses": self._misses,
+            }
+
+    def _drop_stale(self):
+        cutoff = time.time() - self.max_age
+        self._stock = [entry for entry in self._stock if entry["created_at"] >= cutoff]
+
+    def _next_prompt(self) -> str:
+        """The prompt with the fewest stories in stock, breaking ties at random."""
+        in_stock = {prompt: 0 for prompt in self.prompts}
+        for entry in self._stock:
+            in_stock[entry["prompt"]] += 1
+        fewest = min(in_stock.values())
+        return random.choice([prompt for prompt, count in in_stock.items() if count == fewest])
+
+    def _warm(self):
+        while True:
+            with self._cond:
+                self._drop_stale()
+                while len(self._stock) >= self.size:
+                    # Wake up in time to replace the oldest story when it goes stale
+                    oldest = min(entry["created_at"] for entry in self._stock)
+                    self._cond.wait(max(1.0, oldest + self.max_age - time.time()))
+                    self._drop_stale()
+                prompt = self._next_prompt()
+
+            try:
+                entry = self._generate(prompt)
+            except Exception as e:
+                logger.error(f"Could not pre-generate a surprise story: {str(e)}")
+                time.sleep(SURPRISE_RETRY_SECONDS)
+                continue
+
+            with self._cond:
+                self._stock.append(entry)
+
+    def _generate(self, prompt: str) -> dict:
+        # Always a fresh story: the prompts repeat by design
+        story, feedback = self.generator.generate_story(prompt, reuse=False)
+        if not story:
+            raise RuntimeError("The model returned no story")
+        pdf_filename = self.generator.generate_pdf(story, feedback, prompt) if self.with_pdf else None
+        return {
+            "prompt": prompt,
+            "story": story,
+            "feedback": feedback,
+            "pdf_filename": pdf_filename,
+            "created_at": time.time(),
+        }
@@ -0,0 +1,242 @@
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Where finished spans go: "" (kept in memory only), "jsonl" or "otlp"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+# File the jsonl exporter appends one span per line to
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+# OTLP/HTTP (JSON encoding) endpoint of a trace collector
+OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+# Seconds between export batches
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "2"))
+# Recent traces kept in memory for lookup by request ID
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "200"))
+
+SERVICE_NAME = "bedtime-story-generator"
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation in a trace, with attributes describing it."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def current_span():
+    return _current.get()
+
+
+def set_attributes(**attributes):
+    """Add attributes to the current span, if there is one."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def start_span(name: str, **attributes) -> Span:
+    """Open a child of the current span without making it current; close it with end_span.
+
+    For work such as generators, whose body doesn't sit inside one with block.
+    """
+    parent = _current.get()
+    return Span(name, parent.trace_id if parent else secrets.token_hex(16),
+                parent.span_id if parent else None, attributes)
+
+
+def end_span(finished: Span):
+    finished.end_ns = time.time_ns()
+    _record(finished)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the body of the with block as a child of the current span.
+
+    With no current span this starts a new trace, whose ID doubles as the request ID.
+    """
+    new = start_span(name, **attributes)
+    token = _current.set(new)
+    try:
+        yield new
+    except BaseException as e:
+        new.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        end_span(new)
+
+
+def traced(name: str = None):
+    """Decorator running each call of a function in its own span (named after it by default)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def bind(fn):
+    """Wrap fn so it runs under the caller's current span, e.g. on a thread pool."""
+    parent = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+_traces = OrderedDict()
+_traces_lock = threading.Lock()
+
+
+def get_trace(trace_id: str) -> list:
+    """Finished spans of a recent trace, oldest first, or an empty list."""
+    with _traces_lock:
+        return [s.to_dict() for s in _traces.get(trace_id, [])]
+
+
+def _record(finished: Span):
+    with _traces_lock:
+        spans = _traces.get(finished.trace_id)
+        if spans is None:
+            spans = _traces[finished.trace_id] = []
+            while len(_traces) > TRACE_KEEP:
+                _traces.popitem(last=False)
+        spans.append(finished)
+    if _exporter is not None:
+        _exporter.submit(finished)
+
+
+def otlp_payload(spans) -> dict:
+    """Encode spans as an OTLP/JSON ExportTraceServiceRequest."""
+    def value(v):
+        if isinstance(v, bool):
+            return {"boolValue": v}
+        if isinstance(v, int):
+            return {"intValue": str(v)}
+        if isinstance(v, float):
+            return {"doubleValue": v}
+        return {"stringValue": str(v)}
+
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": __name__},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": value(v)} for k, v in s.attributes.items() if v is not None],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+class SpanExporter:
+    """Ships finished spans in batches from a background thread, off the request path."""
+
+    def __init__(self, mode: str, path: str = TRACE_FILE, endpoint: str = OTLP_ENDPOINT,
+                 flush_seconds: float = TRACE_FLUSH_SECONDS):
+        if mode not in ("jsonl", "otlp"):
+            raise ValueError(f"Unknown trace exporter: {mode!r}")
+        self.mode = mode
+        self.path = path
+        self.endpoint = endpoint
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=10000)
+        self._session = None
+        self._flush_lock = threading.Lock()
+        threading.Thread(target=self._run, name="span-exporter", daemon=True).start()
+        atexit.register(self.flush)
+
+    def submit(self, finished: Span):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            logger.warning("Trace export queue is full, dropping span")
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        try:
+            if self.mode == "jsonl":
+                with open(self.path, "a") as f:
+                    f.write("".join(json.dumps(s.to_dict()) + "\n" for s in batch))
+            else:
+                if self._session is None:
+                    import requests
+                    self._session = requests.Session()
+                self._session.post(self.endpoint, json=otlp_payload(batch), timeout=5).raise_for_status()
+        except Exception as e:
+            logger.warning(f"Could not export {len(batch)} spans: {str(e)}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+
+_exporter = SpanExporter(TRACE_EXPORT) if TRACE_EXPORT else None
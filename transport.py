@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import random
+import time
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import API_REQUEST_SECONDS, API_REQUESTS, API_RETRIES
+from rate_limiter import CHAT_GOVERNOR, IMAGE_GOVERNOR, Governor
+
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+# Keep-alive connections held open to the API
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "20"))
+# Seconds to wait for a connection, and for a response once connected
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_CHAT_TIMEOUT = float(os.getenv("OPENAI_CHAT_TIMEOUT", "120"))
+OPENAI_IMAGE_TIMEOUT = float(os.getenv("OPENAI_IMAGE_TIMEOUT", "90"))
+# Retries after the first attempt for rate limits, server errors and dropped connections
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class TransportError(Exception):
+    """Raised when an API call fails for good."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_retry_after(value):
+    """Turn a Retry-After header (seconds or HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(payload: dict) -> int:
+    """Rough token count a chat call will be charged for (about 4 characters per token)."""
+    prompt_chars = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+    return prompt_chars // 4 + payload.get("max_tokens", 0)
+
+
+class OpenAITransport:
+    """Pooled HTTP client for the OpenAI REST API with timeouts and retries."""
+
+    def __init__(self, api_base: str = OPENAI_API_BASE, pool_size: int = OPENAI_POOL_SIZE,
+                 connect_timeout: float = OPENAI_CONNECT_TIMEOUT, max_retries: int = OPENAI_MAX_RETRIES,
+                 backoff_base: float = OPENAI_BACKOFF_BASE, backoff_max: float = OPENAI_BACKOFF_MAX,
+                 chat_governor: Governor = CHAT_GOVERNOR, image_governor: Governor = IMAGE_GOVERNOR):
+        self.chat_governor = chat_governor
+        self.image_governor = image_governor
+        self.api_base = api_base.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def chat_completion(self, api_key: str, payload: dict, read_timeout: float = OPENAI_CHAT_TIMEOUT) -> dict:
+        """Create a chat completion and return the decoded response."""
+        estimated = estimate_tokens(payload)
+        resp = self._post("/chat/completions", api_key, payload, read_timeout,
+                          governor=self.chat_governor, tokens=estimated).json()
+        actual = resp.get("usage", {}).get("total_tokens")
+        if self.chat_governor is not None and actual is not None:
+            self.chat_governor.settle(estimated, actual)
+        return resp
+
+    def stream_chat_completion(self, api_key: str, payload: dict, read_timeout: float = OPENAI_CHAT_TIMEOUT):
+        """Create a streamed chat completion and yield content deltas as they arrive.
+
+        Only the initial request is retried; once tokens flow, a dropped stream is an error.
+        """
+        # The in-flight slot is held until the whole stream has been read
+        governor = self.chat_governor.acquire(estimate_tokens(payload)) if self.chat_governor else nullcontext()
+        with governor, self._post("/chat/completions", api_key, dict(payload, stream=True), read_timeout,
+                                  stream=True) as resp:
+            for line in resp.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[len(b"data: "):].strip()
+                if data == b"[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    def create_image(self, api_key: str, payload: dict, read_timeout: float = OPENAI_IMAGE_TIMEOUT) -> dict:
+        """Generate images and return the decoded response."""
+        return self._post("/images/generations", api_key, payload, read_timeout,
+                          governor=self.image_governor, request_count=payload.get("n", 1)).json()
+
+    def backoff_delay(self, attempt: int, retry_after: float = None) -> float:
+        """Seconds to sleep before retry number attempt (0-based), with full jitter."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _post(self, path: str, api_key: str, payload: dict, read_timeout: float, stream: bool = False,
+              governor: Governor = None, tokens: float = 0, request_count: int = 1) -> requests.Response:
+        url = self.api_base + path
+        endpoint = path.lstrip("/")
+        headers = {"Authorization": f"Bearer {api_key}"}
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                with governor.acquire(tokens, request_count) if governor else nullcontext():
+                    with API_REQUEST_SECONDS.time(endpoint=endpoint):
+                        resp = self.session.post(
+                            url,
+                            json=payload,
+                            headers=headers,
+                            timeout=(self.connect_timeout, read_timeout),
+                            stream=stream
+                        )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                API_REQUESTS.inc(endpoint=endpoint, status="error")
+                error = TransportError(f"Request to {path} failed: {e}")
+            else:
+                API_REQUESTS.inc(endpoint=endpoint, status=str(resp.status_code))
+                if resp.status_code < 400:
+                    return resp
+                error = TransportError(
+                    f"Request to {path} returned {resp.status_code}: {resp.text[:500]}",
+                    status=resp.status_code
+                )
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                resp.close()
+                if resp.status_code not in RETRY_STATUSES:
+                    raise error
+
+            if attempt == self.max_retries:
+                raise error
+            delay = self.backoff_delay(attempt, retry_after)
+            API_RETRIES.inc(endpoint=endpoint)
+            logger.warning(f"{error}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class _APIClient:
+    """An API key bound to a transport. Immutable, so any number of threads can share one."""
+
+    __slots__ = ("transport", "api_key")
+
+    def __init__(self, transport: OpenAITransport, api_key: str):
+        object.__setattr__(self, "transport", transport)
+        object.__setattr__(self, "api_key", api_key)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable; create a new client instead")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable; create a new client instead")
+
+    def __repr__(self):
+        # Never print the key itself
+        return f"{type(self).__name__}(api_base={self.transport.api_base!r})"
+
+
+class ChatClient(_APIClient):
+    """Chat completions, sent with the chat backend's key."""
+
+    __slots__ = ()
+
+    def complete(self, payload: dict, read_timeout: float = OPENAI_CHAT_TIMEOUT) -> dict:
+        return self.transport.chat_completion(self.api_key, payload, read_timeout)
+
+    def stream(self, payload: dict, read_timeout: float = OPENAI_CHAT_TIMEOUT):
+        return self.transport.stream_chat_completion(self.api_key, payload, read_timeout)
+
+
+class ImageClient(_APIClient):
+    """Image generations, sent with the image backend's key."""
+
+    __slots__ = ()
+
+    def generate(self, payload: dict, read_timeout: float = OPENAI_IMAGE_TIMEOUT) -> dict:
+        return self.transport.create_image(self.api_key, payload, read_timeout)